@@ -1,130 +1,359 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
-import pdfplumber
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
 import io
+import os
+import json
 import uvicorn
-from extractor import CopelExtractor
+from extractor import CopelExtractor, SECOES, executar_isolado, secoes_a_retentar
+from leitor_pdf import extrair_texto_pdf, extrair_texto_ocr
+from faturas_agrupadas import processar_pdf_agrupado, iterar_pdf_agrupado
+from referencia_tarifas import ReferenciaTarifas
+from creditos_scee import LivroCreditosSCEE
+from triagem import triar_pdf
+
+try:
+    import orjson
+except ImportError:
+    # Encoder opcional: sem orjson a resposta usa o json da biblioteca padrão
+    orjson = None
 
 app = FastAPI(title="Lex Energia Extractor API")
+
+# Faixas de tarifa TE/TUSD aprendidas das faturas já processadas (SQLite local compartilhado entre workers)
+referencia = ReferenciaTarifas()
 ex = CopelExtractor()
 
+# Histórico de créditos SCEE por UC (SQLite local compartilhado com ingestão, teste.py e armazém)
+livro_creditos = LivroCreditosSCEE()
+
+# OCR (paddleocr) em páginas sem camada de texto; desligado por padrão por ser caro.
+# Habilitado, também refaz pelo OCR só as seções que falharam na camada de texto
+OCR_HABILITADO = os.getenv("OCR_HABILITADO", "0") == "1"
+
+# Seções calculadas aqui (analisar_fatura) e as seções do extract_all de que dependem
+SECOES_ANALISE = {
+    "analise_energia_solar": ["itens", "fatura", "tecnico"],
+    "anomalias_detectadas": ["itens", "fatura", "tecnico", "tributos"]
+}
+
+
+def dumps_json(dados):
+    """Serializa a resposta em bytes (orjson quando instalado)"""
+    if orjson is not None:
+        return orjson.dumps(dados)
+    return json.dumps(dados, ensure_ascii=False).encode("utf-8")
+
+
+def resposta_json(dados):
+    # Response pronta: evita o jsonable_encoder do FastAPI, que percorre o payload inteiro
+    return Response(content=dumps_json(dados), media_type="application/json")
+
+
+def interpretar_campos(fields):
+    """
+    "fatura.valor_total,cliente.uc,itens" -> (campos, seções do extract_all necessárias).
+    fields vazio = payload completo: (None, None).
+    """
+    if not fields:
+        return None, None
+
+    campos = [c.strip() for c in fields.split(",") if c.strip()]
+    secoes = set()
+
+    for campo in campos:
+        secao = campo.split(".")[0]
+        if secao in SECOES_ANALISE:
+            secoes.update(SECOES_ANALISE[secao])
+        elif secao in SECOES:
+            secoes.add(secao)
+        else:
+            raise HTTPException(status_code=400, detail=f"Campo desconhecido em fields: {campo}")
+
+    return campos, secoes
+
+
+def projetar(dados, campos):
+    """Mantém só os campos pedidos ("secao" inteira ou "secao.campo")"""
+    if campos is None:
+        return dados
+
+    resultado = {}
+    for campo in campos:
+        secao, _, sub = campo.partition(".")
+        if secao not in dados:
+            continue
+
+        valor = dados[secao]
+        if sub and isinstance(valor, dict):
+            destino = resultado.setdefault(secao, {})
+            # Seção inteira já pedida: o subcampo já está lá
+            if destino is not valor:
+                destino[sub] = valor.get(sub)
+        else:
+            resultado[secao] = valor
+
+    return resultado
+
+
+def analisar_fatura(dados):
+    """Acrescenta analise_energia_solar e anomalias_detectadas ao resultado do extract_all"""
+    # ============================================================================
+    # CORREÇÃO CRÍTICA C: Cálculos de Energia Solar
+    # ============================================================================
+
+    itens = dados['itens']
+
+    # INJETADA: Soma o valor ABSOLUTO (energia injetada é negativa)
+    inj = sum(abs(i['quantidade']) for i in itens if i['tipo'] == "INJETADA")
+
+    # CONSUMIDA: Usa APENAS TE (Tarifa de Energia)
+    # ⚠️ IMPORTANTE: TE e TUSD incidem sobre o MESMO kWh consumido!
+    # Somar os dois dobraria o consumo real.
+    # 
+    # Exemplo:
+    # - Cliente consumiu 300 kWh
+    # - Paga TE:   R$ 0,40/kWh × 300 = R$ 120,00
+    # - Paga TUSD: R$ 0,45/kWh × 300 = R$ 135,00
+    # - Consumo real = 300 kWh (NÃO 600!)
+    cons = sum(i['quantidade'] for i in itens if i['tipo'] == "TE" and i['quantidade'] > 0)
+
+    # Cálculo de compensação solar (energia injetada que abate do consumo)
+    # Na prática, a energia injetada compensa o consumo de energia
+    consumo_liquido = max(cons - inj, 0)  # Consumo após compensação solar
+    economia_solar = min(inj, cons)  # Energia efetivamente compensada
+
+    # Percentual de abatimento (quanto da energia consumida foi compensada)
+    percentual_abatimento = round((economia_solar / cons) * 100, 2) if cons > 0 else 0
+
+    # Verifica se a UC é autossuficiente (injeta mais do que consome)
+    autossuficiente = inj >= cons if cons > 0 else False
+
+    # Cálculo de créditos (energia injetada que sobra para outros meses)
+    creditos_gerados = max(inj - cons, 0) if cons > 0 else inj
+
+    dados["analise_energia_solar"] = {
+        # Valores básicos
+        "total_consumido_kwh": round(cons, 2),
+        "total_injetado_kwh": round(inj, 2),
+
+        # Análise de compensação
+        "consumo_liquido_kwh": round(consumo_liquido, 2),
+        "economia_solar_kwh": round(economia_solar, 2),
+        "percentual_abatimento": percentual_abatimento,
+
+        # Status da UC
+        "autossuficiente": autossuficiente,
+        "creditos_gerados_kwh": round(creditos_gerados, 2),
+
+        # Metadados
+        "chave_acesso": dados['fatura'].get('chave_acesso'),
+        "mes_referencia": dados['fatura'].get('mes_referencia'),
+
+        # Detalhamento financeiro (se disponível)
+        "valor_total_fatura": dados['fatura'].get('valor_total', 0),
+
+        # Informação sobre método de cálculo
+        "_observacao": "Consumo calculado usando apenas TE (Tarifa de Energia). TE e TUSD incidem sobre o mesmo kWh."
+    }
+
+    # ============================================================================
+    # Análise adicional: Identificação de anomalias
+    # ============================================================================
+
+    anomalias = []
+
+    # Verifica se há valores suspeitos nos itens
+    for item in itens:
+        # Tarifa acima do teto observado no mesmo mês/modalidade/grupo/classe (só sinaliza)
+        faixa = referencia.faixa(dados, item['tipo']) if item['tipo'] in ['TE', 'TUSD'] else None
+        if faixa and abs(item.get('tarifa_unitaria', 0)) > faixa[1]:
+            anomalias.append({
+                "tipo": "tarifa_acima_referencia",
+                "descricao": f"Tarifa unitária R$ {item['tarifa_unitaria']}/kWh acima do esperado "
+                             f"para o mês (até R$ {round(faixa[1], 6)}/kWh)",
+                "item": item['descricao']
+            })
+
+        # Tarifa muito alta (pode indicar parsing errado)
+        elif item['tipo'] in ['TE', 'TUSD'] and abs(item.get('tarifa_unitaria', 0)) > 10:
+            anomalias.append({
+                "tipo": "tarifa_alta",
+                "descricao": f"Tarifa unitária suspeita: R$ {item['tarifa_unitaria']}/kWh",
+                "item": item['descricao']
+            })
+
+        # Quantidade muito alta para residencial
+        if item['tipo'] in ['TE', 'TUSD'] and abs(item.get('quantidade', 0)) > 10000:
+            anomalias.append({
+                "tipo": "quantidade_alta",
+                "descricao": f"Quantidade suspeita: {item['quantidade']} kWh",
+                "item": item['descricao']
+            })
+
+    # Verifica se há inconsistência entre consumo e injeção
+    if cons > 0 and inj > cons * 3:
+        anomalias.append({
+            "tipo": "injecao_alta",
+            "descricao": f"Injeção ({inj} kWh) é mais de 3x o consumo ({cons} kWh)",
+            "item": "Análise geral"
+        })
+
+    if anomalias:
+        dados["anomalias_detectadas"] = anomalias
+
+    return dados
+
+
+def registrar_historico(dados):
+    """Alimenta a referência de tarifas e o livro de créditos; anexa o saldo histórico à análise solar"""
+    # Fatura com tarifa sinalizada não entra na referência (o registrar também recusa
+    # tarifa fora da faixa; aqui cobre ainda o teto fixo de R$ 10/kWh)
+    if not any(a['tipo'].startswith('tarifa_') for a in dados.get('anomalias_detectadas', [])):
+        referencia.registrar(dados)
+
+    if livro_creditos.registrar(dados):
+        uc = dados['cliente']['uc']
+        dados["analise_energia_solar"]["historico_creditos"] = {
+            "saldo_kwh": round(livro_creditos.saldo(uc, dados['fatura']['mes_referencia']), 2),
+            "projecao_expiracao": livro_creditos.projecao_expiracao(uc)
+        }
+
+    return dados
+
+
+def _processar_dados(dados, campos, status):
+    """
+    Análise + histórico sobre o extract_secoes, conforme os campos pedidos. Cada etapa
+    roda isolada: falha vira status (em status_secoes) e o resto da resposta sai igual.
+    """
+    if campos is None or any(c.split(".")[0] in SECOES_ANALISE for c in campos):
+        falhas = [s for s in SECOES_ANALISE["analise_energia_solar"] if status.get(s, {}).get("status") == "erro"]
+        executar_isolado("analise", lambda: analisar_fatura(dados), status, falhas)
+
+    if campos is None:
+        # Payload completo: também alimenta referência de tarifas e livro de créditos,
+        # mas só com a fatura inteira extraída (parcial distorceria as faixas e os saldos)
+        if not secoes_a_retentar(status) and status["analise"]["status"] == "ok":
+            executar_isolado("registro_historico", lambda: registrar_historico(dados), status)
+    else:
+        dados = projetar(dados, campos)
+
+    dados["status_secoes"] = status
+    return dados
+
+
+def _retentar_com_ocr(content, dados, status):
+    """Refaz só as seções com erro/degradadas sobre o texto do OCR; as que voltam ok substituem as anteriores"""
+    retentar = secoes_a_retentar(status)
+    texto_ocr = executar_isolado("ocr", lambda: extrair_texto_ocr(content), status) if retentar else None
+    if not texto_ocr or not texto_ocr.strip():
+        return
+
+    refeitos, status_ocr = ex.extract_secoes(texto_ocr, retentar, anteriores=dados)
+    for secao in retentar:
+        if status_ocr[secao]["status"] == "ok":
+            dados[secao] = refeitos[secao]
+            status[secao] = {**status_ocr[secao], "texto": "ocr"}
+
+
+DESCRICAO_FIELDS = ("Campos a devolver, separados por vírgula: seção inteira (itens) ou seção.campo "
+                    "(fatura.valor_total, cliente.uc). Só as seções necessárias são extraídas.")
+
 
 @app.post("/processar-fatura")
-async def processar_fatura(pdf: UploadFile = File(...)):
+async def processar_fatura(pdf: UploadFile = File(...), fields: str = Query(None, description=DESCRICAO_FIELDS)):
     # Validação simples de arquivo
     if not pdf.filename.lower().endswith(".pdf"):
         raise HTTPException(status_code=400, detail="O arquivo enviado deve ser um PDF.")
 
-    try:
-        content = await pdf.read()
+    campos, secoes = interpretar_campos(fields)
+    content = await pdf.read()
 
-        with pdfplumber.open(io.BytesIO(content)) as p:
-            # Extrai texto de todas as páginas
-            raw_text = "\n".join([page.extract_text() or "" for page in p.pages])
+    try:
+        # Extrai texto de todas as páginas (uma por vez, liberando o cache de cada uma).
+        # PDFs grandes (faturas agrupadas) são divididos entre processos automaticamente
+        raw_text = extrair_texto_pdf(io.BytesIO(content), ocr=OCR_HABILITADO)
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"PDF ilegível: {str(e)}")
 
-        if not raw_text.strip():
-            raise HTTPException(status_code=422, detail="Não foi possível extrair texto do PDF (pode ser uma imagem).")
+    if not raw_text.strip():
+        raise HTTPException(status_code=422, detail="Não foi possível extrair texto do PDF (pode ser uma imagem).")
 
-        # Extração completa usando a classe CopelExtractor
-        dados = ex.extract_all(raw_text)
+    # Extração usando a classe CopelExtractor (só as seções pedidas em fields), cada seção
+    # isolada: erro numa delas volta como status e as demais saem normalmente
+    dados, status = ex.extract_secoes(raw_text, secoes)
 
-        # ============================================================================
-        # CORREÇÃO CRÍTICA C: Cálculos de Energia Solar
-        # ============================================================================
+    if OCR_HABILITADO:
+        _retentar_com_ocr(content, dados, status)
 
-        itens = dados['itens']
+    if all(s["status"] == "erro" for secao, s in status.items() if secao in dados):
+        raise HTTPException(status_code=422, detail={"erro": "Nenhuma seção extraída do PDF.", "status_secoes": status})
 
-        # INJETADA: Soma o valor ABSOLUTO (energia injetada é negativa)
-        inj = sum(abs(i['quantidade']) for i in itens if i['tipo'] == "INJETADA")
+    return resposta_json(_processar_dados(dados, campos, status))
 
-        # CONSUMIDA: Usa APENAS TE (Tarifa de Energia)
-        # ⚠️ IMPORTANTE: TE e TUSD incidem sobre o MESMO kWh consumido!
-        # Somar os dois dobraria o consumo real.
-        # 
-        # Exemplo:
-        # - Cliente consumiu 300 kWh
-        # - Paga TE:   R$ 0,40/kWh × 300 = R$ 120,00
-        # - Paga TUSD: R$ 0,45/kWh × 300 = R$ 135,00
-        # - Consumo real = 300 kWh (NÃO 600!)
-        cons = sum(i['quantidade'] for i in itens if i['tipo'] == "TE" and i['quantidade'] > 0)
 
-        # Cálculo de compensação solar (energia injetada que abate do consumo)
-        # Na prática, a energia injetada compensa o consumo de energia
-        consumo_liquido = max(cons - inj, 0)  # Consumo após compensação solar
-        economia_solar = min(inj, cons)  # Energia efetivamente compensada
+@app.post("/processar-fatura-agrupada")
+async def processar_fatura_agrupada(pdf: UploadFile = File(...),
+                                    fields: str = Query(None, description=DESCRICAO_FIELDS),
+                                    ndjson: bool = Query(False, description="Uma fatura por linha, enviada assim que fica pronta")):
+    """PDF consolidado com várias UCs: separa as faturas e extrai cada uma em paralelo"""
+    if not pdf.filename.lower().endswith(".pdf"):
+        raise HTTPException(status_code=400, detail="O arquivo enviado deve ser um PDF.")
 
-        # Percentual de abatimento (quanto da energia consumida foi compensada)
-        percentual_abatimento = round((economia_solar / cons) * 100, 2) if cons > 0 else 0
+    campos, secoes = interpretar_campos(fields)
 
-        # Verifica se a UC é autossuficiente (injeta mais do que consome)
-        autossuficiente = inj >= cons if cons > 0 else False
+    try:
+        content = await pdf.read()
 
-        # Cálculo de créditos (energia injetada que sobra para outros meses)
-        creditos_gerados = max(inj - cons, 0) if cons > 0 else inj
+        if ndjson:
+            def linhas():
+                try:
+                    for dados, status in iterar_pdf_agrupado(content, ocr=OCR_HABILITADO, secoes=secoes, isolar=True):
+                        yield dumps_json(_processar_dados(dados, campos, status)) + b"\n"
+                except Exception as e:
+                    # Cabeçalho já enviado: o erro vai como última linha do stream
+                    yield dumps_json({"erro": f"PDF ilegível: {str(e)}"}) + b"\n"
 
-        dados["analise_energia_solar"] = {
-            # Valores básicos
-            "total_consumido_kwh": round(cons, 2),
-            "total_injetado_kwh": round(inj, 2),
+            return StreamingResponse(linhas(), media_type="application/x-ndjson")
 
-            # Análise de compensação
-            "consumo_liquido_kwh": round(consumo_liquido, 2),
-            "economia_solar_kwh": round(economia_solar, 2),
-            "percentual_abatimento": percentual_abatimento,
+        faturas = [_processar_dados(dados, campos, status)
+                   for dados, status in processar_pdf_agrupado(content, ocr=OCR_HABILITADO, secoes=secoes, isolar=True)]
 
-            # Status da UC
-            "autossuficiente": autossuficiente,
-            "creditos_gerados_kwh": round(creditos_gerados, 2),
+        return resposta_json({
+            "quantidade_faturas": len(faturas),
+            "faturas": faturas
+        })
 
-            # Metadados
-            "chave_acesso": dados['fatura'].get('chave_acesso'),
-            "mes_referencia": dados['fatura'].get('mes_referencia'),
+    except Exception as e:
+        # Seções já são isoladas por fatura: o que sobra aqui é leitura/separação do PDF
+        raise HTTPException(status_code=422, detail=f"PDF ilegível: {str(e)}")
 
-            # Detalhamento financeiro (se disponível)
-            "valor_total_fatura": dados['fatura'].get('valor_total', 0),
 
-            # Informação sobre método de cálculo
-            "_observacao": "Consumo calculado usando apenas TE (Tarifa de Energia). TE e TUSD incidem sobre o mesmo kWh."
-        }
+@app.post("/triagem")
+async def triagem(pdf: UploadFile = File(...)):
+    """Roteamento barato: UC, mês, emitente Copel, camada de texto e SCEE pela primeira página de fatura (sem OCR)"""
+    if not pdf.filename.lower().endswith(".pdf"):
+        raise HTTPException(status_code=400, detail="O arquivo enviado deve ser um PDF.")
 
-        # ============================================================================
-        # Análise adicional: Identificação de anomalias
-        # ============================================================================
-
-        anomalias = []
-
-        # Verifica se há valores suspeitos nos itens
-        for item in itens:
-            # Tarifa muito alta (pode indicar parsing errado)
-            if item['tipo'] in ['TE', 'TUSD'] and abs(item.get('tarifa_unitaria', 0)) > 10:
-                anomalias.append({
-                    "tipo": "tarifa_alta",
-                    "descricao": f"Tarifa unitária suspeita: R$ {item['tarifa_unitaria']}/kWh",
-                    "item": item['descricao']
-                })
-
-            # Quantidade muito alta para residencial
-            if item['tipo'] in ['TE', 'TUSD'] and abs(item.get('quantidade', 0)) > 10000:
-                anomalias.append({
-                    "tipo": "quantidade_alta",
-                    "descricao": f"Quantidade suspeita: {item['quantidade']} kWh",
-                    "item": item['descricao']
-                })
-
-        # Verifica se há inconsistência entre consumo e injeção
-        if cons > 0 and inj > cons * 3:
-            anomalias.append({
-                "tipo": "injecao_alta",
-                "descricao": f"Injeção ({inj} kWh) é mais de 3x o consumo ({cons} kWh)",
-                "item": "Análise geral"
-            })
+    try:
+        return resposta_json(triar_pdf(await pdf.read()))
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"PDF ilegível: {str(e)}")
 
-        if anomalias:
-            dados["anomalias_detectadas"] = anomalias
 
-        return dados
+@app.get("/creditos/{uc}")
+async def creditos_uc(uc: str, meses: int = 12):
+    """Extrato de créditos SCEE da UC e projeção do que expira nos próximos meses"""
+    extrato = livro_creditos.extrato(uc)
+    if not extrato:
+        raise HTTPException(status_code=404, detail="UC sem histórico de créditos.")
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro interno no processamento: {str(e)}")
+    return {
+        "uc": uc,
+        "saldo_kwh": round(livro_creditos.saldo(uc), 2),
+        "extrato": extrato,
+        "projecao_expiracao": livro_creditos.projecao_expiracao(uc, meses)
+    }
 
 
 @app.get("/health")
@@ -145,6 +374,9 @@ async def root():
         "version": "3.0",
         "endpoints": {
             "processar_fatura": "POST /processar-fatura",
+            "processar_fatura_agrupada": "POST /processar-fatura-agrupada",
+            "triagem": "POST /triagem",
+            "creditos": "GET /creditos/{uc}",
             "health": "GET /health",
             "docs": "GET /docs"
         },
@@ -0,0 +1,253 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from extractor import CopelExtractor, SECOES
+from creditos_scee import LivroCreditosSCEE
+
+# Texto bruto de cada fatura (comprimido) + último resultado extraído e as versões
+# dos extract_* que o produziram. Corrigir o parser não exige reler os PDFs.
+ARQUIVO_ARMAZEM = os.getenv("ARQUIVO_ARMAZEM", "armazem_faturas.db")
+NIVEL_COMPRESSAO = 6
+
+# Faturas por tarefa do pool no reprocessamento
+TAMANHO_LOTE = 200
+
+ex = CopelExtractor()
+
+
+class ArmazemFaturas:
+    """SQLite local com texto bruto por hash do PDF; seguro para vários processos gravando"""
+
+    def __init__(self, caminho=ARQUIVO_ARMAZEM):
+        self.conn = sqlite3.connect(caminho, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS faturas (
+                hash TEXT PRIMARY KEY,
+                arquivo TEXT,
+                texto BLOB,
+                dados TEXT,
+                versoes TEXT,
+                atualizado_em REAL,
+                erros TEXT
+            )
+        """)
+        # Bancos criados antes da coluna de erros do reprocessamento
+        colunas = {linha[1] for linha in self.conn.execute("PRAGMA table_info(faturas)")}
+        if "erros" not in colunas:
+            self.conn.execute("ALTER TABLE faturas ADD COLUMN erros TEXT")
+        self.conn.commit()
+
+    def guardar(self, conteudo_hash, arquivo, texto, dados=None):
+        """Grava o texto bruto do PDF e, se houver, o extract_all completo feito agora"""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO faturas (hash, arquivo, texto, dados, versoes, atualizado_em) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (conteudo_hash, arquivo, zlib.compress(texto.encode("utf-8"), NIVEL_COMPRESSAO),
+             json.dumps(dados, ensure_ascii=False) if dados is not None else None,
+             json.dumps(ex.versoes_secoes()) if dados is not None else None,
+             time.time()))
+        self.conn.commit()
+
+    def texto(self, conteudo_hash):
+        linha = self.conn.execute("SELECT texto FROM faturas WHERE hash = ?", (conteudo_hash,)).fetchone()
+        return zlib.decompress(linha[0]).decode("utf-8") if linha else None
+
+    def pendencias(self, forcar=()):
+        """
+        Lista (hash, seções a refazer, versões gravadas) das faturas com alguma seção
+        extraída por versão diferente da atual (ou forçada). Não lê os textos.
+        """
+        atuais = ex.versoes_secoes()
+        pendentes = []
+
+        for conteudo_hash, versoes in self.conn.execute("SELECT hash, versoes FROM faturas"):
+            versoes = json.loads(versoes) if versoes else {}
+            refazer = [s for s in SECOES if s in forcar or versoes.get(s) != atuais[s]]
+            if refazer:
+                pendentes.append((conteudo_hash, refazer, versoes))
+
+        return pendentes
+
+    def carregar(self, hashes):
+        """{hash: (texto comprimido, dados)} de um lote"""
+        marcadores = ",".join("?" * len(hashes))
+        cursor = self.conn.execute(f"SELECT hash, texto, dados FROM faturas WHERE hash IN ({marcadores})", hashes)
+        return {h: (texto, json.loads(dados) if dados else None) for h, texto, dados in cursor}
+
+    def atualizar(self, resultados):
+        """
+        Grava o resultado do reprocessamento (lista de (hash, dados, versões, erros)).
+        erros = {seção: mensagem} das seções que falharam (None se todas passaram)
+        """
+        agora = time.time()
+        self.conn.executemany(
+            "UPDATE faturas SET dados = ?, versoes = ?, atualizado_em = ?, erros = ? WHERE hash = ?",
+            [(json.dumps(dados, ensure_ascii=False) if dados is not None else None, json.dumps(versoes), agora,
+              json.dumps(erros, ensure_ascii=False) if erros else None, conteudo_hash)
+             for conteudo_hash, dados, versoes, erros in resultados])
+        self.conn.commit()
+
+    def erros(self):
+        """(arquivo, {seção: erro}) das faturas cujo último reprocessamento teve falha"""
+        for arquivo, erros in self.conn.execute("SELECT arquivo, erros FROM faturas WHERE erros IS NOT NULL"):
+            yield arquivo, json.loads(erros)
+
+    def exportar(self):
+        """Registros no formato do teste.py ({"arquivo", "status", "dados"})"""
+        for arquivo, dados in self.conn.execute("SELECT arquivo, dados FROM faturas WHERE dados IS NOT NULL"):
+            yield {"arquivo": arquivo, "status": "OK", "dados": json.loads(dados)}
+
+
+# ============================================================================
+# Reprocessamento (worker)
+# ============================================================================
+
+def _reprocessar_lote(lote):
+    """
+    Refaz só as seções pendentes de cada fatura sobre o texto guardado. Cada seção
+    roda isolada (extract_secoes): a que falha mantém o valor e a versão antigos,
+    fica registrada em erros e volta a ser tentada na próxima execução; o resto
+    da fatura e do lote segue.
+    """
+    resultados = []
+
+    for conteudo_hash, texto, dados, refazer in lote:
+        try:
+            texto = zlib.decompress(texto).decode("utf-8")
+        except Exception as e:
+            # Texto corrompido: nada a refazer nesta fatura
+            resultados.append((conteudo_hash, dados, {}, [], {"texto": f"{type(e).__name__}: {e}"}))
+            continue
+
+        refazer = SECOES if dados is None else refazer
+        novos, status = ex.extract_secoes(texto, refazer, anteriores=dados)
+
+        erros = {s: status[s]["erro"] for s in refazer if status[s]["status"] == "erro"}
+        refeitas = [s for s in refazer if s not in erros]
+
+        dados = {**(dados or {}), **{s: novos[s] for s in refeitas}}
+        dados = {s: dados.get(s) for s in SECOES}
+
+        resultados.append((conteudo_hash, dados, ex.versoes_secoes(refeitas), refeitas, erros))
+
+    return resultados
+
+
+def reprocessar(armazem, forcar=(), workers=None, tamanho_lote=TAMANHO_LOTE, livro_creditos=None):
+    """
+    Reprocessa em paralelo as faturas com seções desatualizadas e devolve (Counter das
+    seções refeitas, Counter das que falharam; "lote" = lote inteiro perdido). Os textos
+    são lidos lote a lote, com no máximo 2x workers lotes em voo.
+    Com livro_creditos, as faturas refeitas também atualizam o livro de créditos SCEE.
+    """
+    pendentes = armazem.pendencias(forcar)
+    versoes_gravadas = {h: versoes for h, _, versoes in pendentes}
+    por_secao = Counter()
+    falhas = Counter()
+
+    def montar(fatia):
+        carregados = armazem.carregar([h for h, _, _ in fatia])
+        return [(h, *carregados[h], refazer) for h, refazer, _ in fatia]
+
+    def gravar(resultado):
+        atualizacoes = []
+        for conteudo_hash, dados, versoes, refeitas, erros in resultado:
+            por_secao.update(refeitas)
+            falhas.update(erros.keys())
+            # Seções não refeitas continuam com a versão com que foram extraídas
+            atualizacoes.append((conteudo_hash, dados, {**versoes_gravadas[conteudo_hash], **versoes}, erros))
+            if livro_creditos is not None and dados is not None and refeitas:
+                try:
+                    livro_creditos.registrar(dados)
+                except Exception as e:
+                    print(f"Livro de créditos: falha ao registrar {conteudo_hash[:12]}: {e}")
+        armazem.atualizar(atualizacoes)
+
+    def colher(futuro, fatia):
+        try:
+            gravar(futuro.result())
+        except Exception as e:
+            # Lote perdido (worker caiu): os demais lotes seguem; este fica pendente
+            falhas["lote"] += 1
+            print(f"Lote de {len(fatia)} faturas perdido: {type(e).__name__}: {e}")
+
+    fatias = [pendentes[i:i + tamanho_lote] for i in range(0, len(pendentes), tamanho_lote)]
+
+    if workers == 1 or len(fatias) < 2:
+        for fatia in fatias:
+            gravar(_reprocessar_lote(montar(fatia)))
+        return por_secao, falhas
+
+    workers = workers or os.cpu_count() or 2
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        limite = workers * 2
+        em_voo = {}  # future -> fatia
+
+        for fatia in fatias:
+            if len(em_voo) >= limite:
+                concluidos, _ = wait(em_voo, return_when=FIRST_COMPLETED)
+                for futuro in concluidos:
+                    colher(futuro, em_voo.pop(futuro))
+            em_voo[pool.submit(_reprocessar_lote, montar(fatia))] = fatia
+
+        for futuro, fatia in em_voo.items():
+            colher(futuro, fatia)
+
+    return por_secao, falhas
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Reextrai do texto guardado só as seções cujo extract_* mudou de versão")
+    parser.add_argument("--armazem", default=ARQUIVO_ARMAZEM, help="Banco SQLite com os textos")
+    parser.add_argument("--forcar", help=f"Seções a refazer mesmo sem mudança de versão ({', '.join(SECOES)})")
+    parser.add_argument("--workers", type=int, default=None, help="Processos (padrão: núcleos da máquina)")
+    parser.add_argument("--saida", help="Exporta todas as faturas atualizadas em JSONL (entrada do auditor)")
+    parser.add_argument("--reconstruir-creditos", action="store_true",
+                        help="Realimenta o livro de créditos SCEE com todas as faturas do armazém")
+    args = parser.parse_args()
+
+    forcar = args.forcar.split(",") if args.forcar else []
+    desconhecidas = set(forcar) - set(SECOES)
+    if desconhecidas:
+        parser.error(f"Seções desconhecidas: {', '.join(sorted(desconhecidas))}")
+
+    armazem = ArmazemFaturas(args.armazem)
+    livro_creditos = LivroCreditosSCEE()
+
+    inicio = time.perf_counter()
+    por_secao, falhas = reprocessar(armazem, forcar, args.workers, livro_creditos=livro_creditos)
+    print(f"Reprocessado em {time.perf_counter() - inicio:.1f}s")
+
+    if args.reconstruir_creditos:
+        # Ordem não importa: o livro recalcula a partir do mês de cada fatura
+        total = sum(1 for registro in armazem.exportar() if livro_creditos.registrar(registro["dados"]))
+        print(f"Livro de créditos realimentado com {total} faturas de GD")
+
+    if not por_secao:
+        print("Nada a refazer: todas as seções estão na versão atual")
+    for secao, total in por_secao.most_common():
+        print(f"  {secao}: {total} faturas")
+
+    if falhas:
+        # Seções que falharam mantêm a versão antiga e são tentadas de novo na próxima execução
+        print("Falhas (detalhe na coluna erros do armazém):")
+        for secao, total in falhas.most_common():
+            print(f"  {secao}: {total}")
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            for registro in armazem.exportar():
+                f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        print(f"Exportado: {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+import os
+import csv
+import json
+import argparse
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+# Tolerâncias padrão (sobrescrevíveis via --config JSON)
+# *_abs em R$ ou kWh; *_rel em fração do valor esperado
+TOLERANCIAS = {
+    "soma_itens_abs": 0.05,
+    "icms_abs": 0.10,
+    "icms_rel": 0.005,
+    "medicao_te_abs": 1.0,
+    "scee_abs": 1.0
+}
+
+ARQUIVO_VIOLACOES = "violacoes_auditoria.csv"
+CAMPOS_RELATORIO = ["arquivo", "uc", "mes_referencia", "regra", "esperado", "obtido", "diferenca"]
+
+
+def _violacao(regra, esperado, obtido):
+    return {
+        "regra": regra,
+        "esperado": round(esperado, 2),
+        "obtido": round(obtido, 2),
+        "diferenca": round(obtido - esperado, 2)
+    }
+
+
+# ============================================================================
+# Regras por fatura: recebem o resultado do extract_all e devolvem violação ou None
+# ============================================================================
+
+def regra_soma_itens(dados, tol):
+    """Soma dos valores dos itens deve fechar com o valor_total da fatura"""
+    itens = dados.get("itens") or []
+    if not itens:
+        return None
+
+    esperado = dados["fatura"].get("valor_total") or 0.0
+    obtido = sum(i["valor_total"] for i in itens)
+
+    if abs(obtido - esperado) > tol["soma_itens_abs"]:
+        return _violacao("soma_itens", esperado, obtido)
+    return None
+
+
+def regra_icms(dados, tol):
+    """Base de cálculo x alíquota deve bater com o valor do ICMS"""
+    icms = (dados.get("tributos") or {}).get("icms")
+    if not icms or not icms["base_calculo"]:
+        return None
+
+    esperado = icms["base_calculo"] * icms["aliquota_percentual"] / 100
+    obtido = icms["valor"]
+
+    if abs(obtido - esperado) > max(tol["icms_abs"], tol["icms_rel"] * esperado):
+        return _violacao("icms", esperado, obtido)
+    return None
+
+
+def regra_medicao_te(dados, tol):
+    """Consumo medido (medições CONSUMO) deve bater com a quantidade faturada em TE"""
+    medido = [m["consumo_kwh"] for m in dados.get("medicoes") or [] if m["tipo"] == "CONSUMO"]
+    if not medido:
+        return None
+
+    # Mesmo critério da análise solar: só TE com quantidade positiva (injeção é negativa)
+    faturado = sum(i["quantidade"] for i in dados.get("itens") or [] if i["tipo"] == "TE" and i["quantidade"] > 0)
+
+    if abs(faturado - sum(medido)) > tol["medicao_te_abs"]:
+        return _violacao("medicao_te", sum(medido), faturado)
+    return None
+
+
+REGRAS_FATURA = {
+    "soma_itens": regra_soma_itens,
+    "icms": regra_icms,
+    "medicao_te": regra_medicao_te
+}
+
+# Regras que cruzam faturas da mesma UC (rodam depois do passe por fatura)
+REGRAS_CARTEIRA = ["scee_continuidade"]
+
+
+def _mes_ordenavel(mes):
+    # "MM/AAAA" -> (AAAA, MM)
+    m, a = mes.split("/")
+    return int(a), int(m)
+
+
+def _mes_seguinte(chave):
+    a, m = chave
+    return (a + 1, 1) if m == 12 else (a, m + 1)
+
+
+def _kwh_compensado(itens):
+    """
+    kWh compensados com créditos na fatura: linhas de injeção/créditos de outros meses
+    (TE com quantidade negativa; TUSD repete o mesmo kWh). Crédito de bandeira fica de fora
+    """
+    return sum(abs(i["quantidade"]) for i in itens
+               if i["quantidade"] < 0 and (i["tipo"] == "TE" or (i["tipo"] == "INJETADA" and "BAND" not in i["descricao"])))
+
+
+def regra_scee_continuidade(resumos, tol):
+    """
+    Saldo acumulado SCEE deve continuar do mês anterior:
+    acumulado(m) ~ acumulado(m-1) + saldo_mes(m) - créditos usados - expirados.
+    Créditos usados não vêm discriminados: a queda aceita vai até os kWh compensados
+    nos itens do mês + o que estava a expirar em m-1. Aumento além do crédito do mês
+    e queda maior que isso são violações.
+    """
+    violacoes = []
+    por_uc = defaultdict(list)
+
+    for r in resumos:
+        if r["scee"] and r["uc"] and r["mes_referencia"]:
+            por_uc[r["uc"]].append(r)
+
+    for faturas in por_uc.values():
+        faturas.sort(key=lambda r: _mes_ordenavel(r["mes_referencia"]))
+
+        for anterior, atual in zip(faturas, faturas[1:]):
+            # Só compara meses consecutivos (buraco no histórico não é violação)
+            if _mes_seguinte(_mes_ordenavel(anterior["mes_referencia"])) != _mes_ordenavel(atual["mes_referencia"]):
+                continue
+
+            esperado = anterior["scee"]["saldo_acumulado_kwh"] + atual["scee"]["saldo_mes_kwh"]
+            obtido = atual["scee"]["saldo_acumulado_kwh"]
+            queda_maxima = atual["compensado_kwh"] + anterior["scee"]["saldo_expirar_kwh"]
+
+            if obtido > esperado + tol["scee_abs"]:
+                v = _violacao("scee_continuidade", esperado, obtido)
+            elif obtido < esperado - queda_maxima - tol["scee_abs"]:
+                # Esperado reportado = menor saldo explicável
+                v = _violacao("scee_continuidade", esperado - queda_maxima, obtido)
+            else:
+                v = None
+
+            if v:
+                v.update(arquivo=atual["arquivo"], uc=atual["uc"], mes_referencia=atual["mes_referencia"])
+                violacoes.append(v)
+
+    return violacoes
+
+
+# ============================================================================
+# Motor
+# ============================================================================
+
+def auditar_fatura(registro, regras=tuple(REGRAS_FATURA), tol=TOLERANCIAS):
+    """
+    Passe único sobre uma fatura: roda as regras selecionadas e devolve
+    (violações, resumo) — o resumo leva só o necessário às regras de carteira.
+    """
+    # Aceita tanto o extract_all puro quanto o registro do teste.py ({"arquivo", "dados"})
+    dados = registro.get("dados", registro)
+    arquivo = registro.get("arquivo")
+    uc = (dados.get("cliente") or {}).get("uc")
+    mes = (dados.get("fatura") or {}).get("mes_referencia")
+
+    violacoes = []
+    for nome in regras:
+        v = REGRAS_FATURA[nome](dados, tol)
+        if v:
+            v.update(arquivo=arquivo, uc=uc, mes_referencia=mes)
+            violacoes.append(v)
+
+    resumo = {"arquivo": arquivo, "uc": uc, "mes_referencia": mes, "scee": dados.get("solar_scee"),
+              "compensado_kwh": _kwh_compensado(dados.get("itens") or [])}
+    return violacoes, resumo
+
+
+def _auditar_lote(lote, regras, tol):
+    return [auditar_fatura(r, regras, tol) for r in lote]
+
+
+def carregar_faturas(caminhos):
+    """Gera os registros de faturas de arquivos .json/.jsonl ou de pastas com eles"""
+    for caminho in caminhos:
+        if os.path.isdir(caminho):
+            for raiz, _, arquivos in os.walk(caminho):
+                yield from carregar_faturas(
+                    sorted(os.path.join(raiz, a) for a in arquivos if a.lower().endswith((".json", ".jsonl"))))
+            continue
+
+        with open(caminho, encoding="utf-8") as f:
+            if caminho.lower().endswith(".jsonl"):
+                for linha in f:
+                    if linha.strip():
+                        yield json.loads(linha)
+            else:
+                conteudo = json.load(f)
+                if isinstance(conteudo, list):
+                    yield from conteudo
+                else:
+                    conteudo.setdefault("arquivo", os.path.basename(caminho))
+                    yield conteudo
+
+
+def auditar_carteira(registros, regras=None, tol=None, workers=None, tamanho_lote=500):
+    """
+    Audita um lote de faturas em paralelo (lotes por processo) e depois roda
+    as regras de carteira. Devolve a lista de violações.
+    """
+    regras = list(regras or list(REGRAS_FATURA) + REGRAS_CARTEIRA)
+    tol = {**TOLERANCIAS, **(tol or {})}
+
+    regras_fatura = tuple(r for r in regras if r in REGRAS_FATURA)
+    desconhecidas = [r for r in regras if r not in REGRAS_FATURA and r not in REGRAS_CARTEIRA]
+    if desconhecidas:
+        raise ValueError(f"Regras desconhecidas: {', '.join(desconhecidas)}")
+
+    registros = list(registros)
+    lotes = [registros[i:i + tamanho_lote] for i in range(0, len(registros), tamanho_lote)]
+
+    violacoes = []
+    resumos = []
+
+    def consumir(resultados):
+        for resultado in resultados:
+            for v, r in resultado:
+                violacoes.extend(v)
+                resumos.append(r)
+
+    n = len(lotes)
+    if workers == 1 or n < 2:
+        consumir(map(_auditar_lote, lotes, [regras_fatura] * n, [tol] * n))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            consumir(pool.map(_auditar_lote, lotes, [regras_fatura] * n, [tol] * n))
+
+    if "scee_continuidade" in regras:
+        violacoes.extend(regra_scee_continuidade(resumos, tol))
+
+    return violacoes
+
+
+def gravar_relatorio(violacoes, caminho=ARQUIVO_VIOLACOES):
+    with open(caminho, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=CAMPOS_RELATORIO)
+        writer.writeheader()
+        writer.writerows(violacoes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Auditoria de consistência interna das faturas extraídas")
+    parser.add_argument("entrada", nargs="+", help="Arquivos .json/.jsonl (saída do extract_all) ou pastas")
+    parser.add_argument("--regras", help=f"Regras separadas por vírgula (padrão: todas: "
+                                         f"{', '.join(list(REGRAS_FATURA) + REGRAS_CARTEIRA)})")
+    parser.add_argument("--config", help="JSON com tolerâncias para sobrescrever o padrão")
+    parser.add_argument("--workers", type=int, default=None, help="Processos (padrão: núcleos da máquina)")
+    parser.add_argument("--saida", default=ARQUIVO_VIOLACOES, help="CSV de violações")
+    args = parser.parse_args()
+
+    tol = None
+    if args.config:
+        with open(args.config, encoding="utf-8") as f:
+            tol = json.load(f)
+
+    regras = args.regras.split(",") if args.regras else None
+    registros = list(carregar_faturas(args.entrada))
+
+    violacoes = auditar_carteira(registros, regras, tol, args.workers)
+    gravar_relatorio(violacoes, args.saida)
+
+    print(f"Faturas auditadas: {len(registros)} | Violações: {len(violacoes)}")
+    for regra, total in Counter(v["regra"] for v in violacoes).most_common():
+        print(f"  {regra}: {total}")
+    print(f"Relatório: {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import re
+import timeit
+
+from extractor import CopelExtractor
+
+ex = CopelExtractor()
+
+
+def br_money_to_float_original(v):
+    """Implementação anterior do CopelExtractor.br_money_to_float (referência)"""
+    if not v:
+        return 0.0
+    v = str(v).replace("R$", "").replace(" ", "")
+    sinal = -1 if "-" in v else 1
+    v = v.replace("-", "").replace(".", "").replace(",", ".")
+    try:
+        return float(v) * sinal
+    except:
+        return 0.0
+
+
+def carregar_tokens():
+    """Números reais do dump de faturas + casos de borda"""
+    try:
+        with open("resultado_todos_pdfs.txt", encoding="utf-8") as f:
+            texto = f.read()
+    except OSError:
+        texto = ""
+
+    tokens = [str(n).replace(".", ",") for n in re.findall(r"-?\d+\.\d+|-?\d+", texto)]
+    tokens += [
+        "0,382519", "1.029,00", "R$ 3.756,26", "R$120,64", "-9.223,00", "-0,33",
+        "266", "", None, "abc", "R $ 5", "0.012", 12, 1.5, "- 7,21"
+    ]
+    return tokens
+
+
+def main():
+    tokens = carregar_tokens()
+
+    # Conferência: o resultado tem que ser idêntico ao da implementação anterior
+    for t in tokens:
+        esperado, obtido = br_money_to_float_original(t), ex.br_money_to_float(t)
+        assert repr(esperado) == repr(obtido), f"{t!r}: {esperado!r} != {obtido!r}"
+
+    n = 20
+    t_original = timeit.timeit(lambda: [br_money_to_float_original(t) for t in tokens], number=n)
+    t_novo = timeit.timeit(lambda: [ex.br_money_to_float(t) for t in tokens], number=n)
+    t_lote = timeit.timeit(lambda: ex.br_money_list_to_float(tokens), number=n)
+
+    total = len(tokens) * n
+    print(f"Tokens: {len(tokens)} x {n} repetições")
+    print(f"Original:            {t_original / total * 1e9:8.1f} ns/token")
+    print(f"br_money_to_float:   {t_novo / total * 1e9:8.1f} ns/token ({t_original / t_novo:.1f}x)")
+    print(f"br_money_list_to_float: {t_lote / total * 1e9:5.1f} ns/token ({t_original / t_lote:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
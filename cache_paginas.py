@@ -0,0 +1,149 @@
+import io
+import os
+import hashlib
+import threading
+
+# Cache local de páginas rasterizadas e de texto OCR (PDFs escaneados).
+# Reprocessar um lote depois de ajustar o extractor pula a renderização e o OCR.
+PASTA_CACHE_PAGINAS = os.getenv("PASTA_CACHE_PAGINAS", ".cache_paginas")
+
+# Limite das imagens em disco; 0 desliga o cache. O texto OCR é pequeno e não entra na conta
+LIMITE_CACHE_PAGINAS_MB = int(os.getenv("LIMITE_CACHE_PAGINAS_MB", "2048"))
+
+# Ao estourar o limite, remove as menos usadas até ficar nessa fração dele
+# (evita varrer a pasta a cada nova página gravada)
+FRACAO_APOS_LIMPEZA = 0.9
+
+# PNG 8 bits em tons de cinza: sem perdas (o OCR vê exatamente a mesma imagem)
+# e nível de compressão baixo, que já reduz bem página de fatura e é rápido
+NIVEL_COMPRESSAO_PNG = 3
+
+
+def hash_fonte(fonte):
+    """sha256 do PDF (caminho ou bytes): a chave não depende do nome do arquivo"""
+    h = hashlib.sha256()
+    if isinstance(fonte, bytes):
+        h.update(fonte)
+    else:
+        with open(fonte, "rb") as f:
+            for bloco in iter(lambda: f.read(1 << 20), b""):
+                h.update(bloco)
+    return h.hexdigest()
+
+
+def hash_imagem(imagem):
+    """sha256 dos pixels (e do tamanho) da imagem já em tons de cinza"""
+    h = hashlib.sha256(f"{imagem.mode}:{imagem.size[0]}x{imagem.size[1]}:".encode())
+    h.update(imagem.tobytes())
+    return h.hexdigest()
+
+
+def _gravar_atomico(caminho, conteudo):
+    # Vários processos podem gravar a mesma chave: arquivo temporário + rename
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    with open(temporario, "wb") as f:
+        f.write(conteudo)
+    os.replace(temporario, caminho)
+
+
+class CachePaginas:
+    """
+    Imagens de página por (hash do PDF, página, DPI) com descarte LRU por tamanho
+    (o mtime do arquivo marca o último uso) e texto OCR por (hash da imagem, versão do motor).
+    """
+
+    def __init__(self, pasta=PASTA_CACHE_PAGINAS, limite_mb=LIMITE_CACHE_PAGINAS_MB):
+        self.pasta_imagens = os.path.join(pasta, "imagens")
+        self.pasta_ocr = os.path.join(pasta, "ocr")
+        self.limite = limite_mb * 1024 * 1024
+        self._lock = threading.Lock()
+
+        os.makedirs(self.pasta_imagens, exist_ok=True)
+        os.makedirs(self.pasta_ocr, exist_ok=True)
+
+        # Tamanho ocupado só é varrido na partida; depois é mantido incrementalmente
+        self._ocupado = sum(tamanho for _, _, tamanho in self._listar_imagens())
+
+    # ------------------------------------------------------------------
+    # Imagens
+    # ------------------------------------------------------------------
+
+    def _caminho_imagem(self, chave_pdf, indice, dpi):
+        return os.path.join(self.pasta_imagens, f"{chave_pdf}_{indice}_{dpi}.png")
+
+    def imagem(self, chave_pdf, indice, dpi):
+        """Imagem PIL da página ou None se não estiver no cache"""
+        from PIL import Image
+
+        caminho = self._caminho_imagem(chave_pdf, indice, dpi)
+        try:
+            with open(caminho, "rb") as f:
+                imagem = Image.open(io.BytesIO(f.read()))
+                imagem.load()
+            os.utime(caminho)  # Marca como usada agora (ordem do LRU)
+        except (FileNotFoundError, OSError):
+            # Ausente, descartada por outro processo no meio da leitura ou corrompida
+            return None
+
+        return imagem
+
+    def guardar_imagem(self, chave_pdf, indice, dpi, imagem):
+        buffer = io.BytesIO()
+        imagem.convert("L").save(buffer, format="PNG", compress_level=NIVEL_COMPRESSAO_PNG)
+        conteudo = buffer.getvalue()
+
+        _gravar_atomico(self._caminho_imagem(chave_pdf, indice, dpi), conteudo)
+
+        with self._lock:
+            self._ocupado += len(conteudo)
+            if self._ocupado > self.limite:
+                self._limpar()
+
+    def _listar_imagens(self):
+        arquivos = []
+        with os.scandir(self.pasta_imagens) as entradas:
+            for entrada in entradas:
+                if not entrada.name.endswith(".png"):
+                    continue
+                try:
+                    st = entrada.stat()
+                except FileNotFoundError:
+                    continue
+                arquivos.append((st.st_mtime, entrada.path, st.st_size))
+        return arquivos
+
+    def _limpar(self):
+        """Remove as imagens usadas há mais tempo até caber em FRACAO_APOS_LIMPEZA do limite"""
+        arquivos = sorted(self._listar_imagens())
+        ocupado = sum(tamanho for _, _, tamanho in arquivos)
+        alvo = self.limite * FRACAO_APOS_LIMPEZA
+
+        for _, caminho, tamanho in arquivos:
+            if ocupado <= alvo:
+                break
+            try:
+                os.remove(caminho)
+            except FileNotFoundError:
+                pass  # Outro processo já limpou
+            ocupado -= tamanho
+
+        # Recontado do disco: corrige o que outros processos gravaram/removeram
+        self._ocupado = ocupado
+
+    # ------------------------------------------------------------------
+    # Texto OCR
+    # ------------------------------------------------------------------
+
+    def _caminho_ocr(self, chave_imagem, versao):
+        chave = hashlib.sha256(f"{versao}:{chave_imagem}".encode()).hexdigest()
+        return os.path.join(self.pasta_ocr, f"{chave}.txt")
+
+    def texto_ocr(self, chave_imagem, versao):
+        try:
+            with open(self._caminho_ocr(chave_imagem, versao), encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def guardar_texto_ocr(self, chave_imagem, versao, texto):
+        _gravar_atomico(self._caminho_ocr(chave_imagem, versao), texto.encode("utf-8"))
@@ -0,0 +1,387 @@
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import socket
+import tempfile
+import argparse
+import threading
+import subprocess
+import http.client
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+# Teste de carga local: sobe o app com uvicorn numa porta livre, reenvia um corpus de
+# PDFs com concorrência e taxa de chegada configuráveis e mede vazão, latência, erros
+# e CPU/RSS de cada processo do servidor. Várias --config rodam em sequência e são comparadas.
+PASTA_APP = os.path.dirname(os.path.abspath(__file__))
+ENDPOINT_PADRAO = "/processar-fatura"
+CONCORRENCIA_PADRAO = 4
+DURACAO_PADRAO = 30.0
+AQUECIMENTO_PADRAO = 3.0
+TIMEOUT_REQUISICAO = 120.0
+TIMEOUT_PARTIDA = 60.0
+INTERVALO_AMOSTRAGEM = 0.5
+
+PERCENTIS = [50, 90, 95, 99]
+
+_TICKS = os.sysconf("SC_CLK_TCK")
+_PAGINA = os.sysconf("SC_PAGE_SIZE")
+
+
+# ============================================================================
+# Corpus
+# ============================================================================
+
+def carregar_corpus(caminhos):
+    """[(nome, bytes)] dos PDFs dos arquivos/pastas (padrão: os PDFs de exemplo do repositório)"""
+    arquivos = []
+    for caminho in caminhos or [PASTA_APP]:
+        if os.path.isdir(caminho):
+            for raiz, _, nomes in os.walk(caminho):
+                arquivos.extend(os.path.join(raiz, n) for n in sorted(nomes) if n.lower().endswith(".pdf"))
+                if caminho == PASTA_APP:
+                    break  # Na pasta do app só os PDFs da raiz (amostras)
+        else:
+            arquivos.append(caminho)
+
+    corpus = []
+    for arquivo in arquivos:
+        with open(arquivo, "rb") as f:
+            corpus.append((os.path.basename(arquivo), f.read()))
+    return corpus
+
+
+def corpo_multipart(nome, conteudo):
+    """Corpo multipart/form-data do campo "pdf" (montado uma vez por arquivo do corpus)"""
+    fronteira = uuid.uuid4().hex
+    corpo = (
+        f"--{fronteira}\r\n"
+        f'Content-Disposition: form-data; name="pdf"; filename="{nome}"\r\n'
+        f"Content-Type: application/pdf\r\n\r\n"
+    ).encode() + conteudo + f"\r\n--{fronteira}--\r\n".encode()
+    return corpo, f"multipart/form-data; boundary={fronteira}"
+
+
+# ============================================================================
+# Servidor local
+# ============================================================================
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Servidor:
+    """uvicorn app:app num subprocesso, com as variáveis de ambiente da configuração"""
+
+    def __init__(self, workers=1, ambiente=None):
+        self.porta = porta_livre()
+        self.workers = workers
+        self.ambiente = ambiente or {}
+        self.processo = None
+
+    def __enter__(self):
+        # Estado do app (referência de tarifas, livro de créditos SCEE, cache de páginas) numa
+        # pasta temporária: o mesmo PDF reenviado mil vezes não pode poluir os dados de verdade
+        self.temporario = tempfile.TemporaryDirectory(prefix="carga_")
+        ambiente = {
+            **os.environ,
+            "ARQUIVO_REFERENCIA_TARIFAS": os.path.join(self.temporario.name, "referencia_tarifas.db"),
+            "ARQUIVO_CREDITOS_SCEE": os.path.join(self.temporario.name, "creditos_scee.db"),
+            "PASTA_CACHE_PAGINAS": os.path.join(self.temporario.name, "cache_paginas"),
+            **self.ambiente
+        }
+
+        comando = [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1",
+                   "--port", str(self.porta), "--workers", str(self.workers), "--log-level", "warning"]
+        self.processo = subprocess.Popen(comando, cwd=PASTA_APP, env=ambiente)
+
+        limite = time.monotonic() + TIMEOUT_PARTIDA
+        while time.monotonic() < limite:
+            if self.processo.poll() is not None:
+                raise RuntimeError(f"uvicorn terminou na partida (código {self.processo.returncode})")
+            try:
+                if requisitar(self.porta, "GET", "/health", timeout=2)[0] == 200:
+                    return self
+            except OSError:
+                pass
+            time.sleep(0.2)
+
+        self.__exit__()
+        raise RuntimeError(f"uvicorn não respondeu em {TIMEOUT_PARTIDA:.0f}s")
+
+    def __exit__(self, *_):
+        self.processo.terminate()
+        try:
+            self.processo.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            self.processo.kill()
+            self.processo.wait()
+        self.temporario.cleanup()
+
+
+def requisitar(porta, metodo, endpoint, corpo=None, content_type=None, timeout=TIMEOUT_REQUISICAO):
+    """(status, bytes da resposta) numa conexão nova, como faria um cliente sem keep-alive"""
+    conexao = http.client.HTTPConnection("127.0.0.1", porta, timeout=timeout)
+    try:
+        cabecalhos = {"Content-Type": content_type} if content_type else {}
+        conexao.request(metodo, endpoint, body=corpo, headers=cabecalhos)
+        resposta = conexao.getresponse()
+        return resposta.status, resposta.read()
+    finally:
+        conexao.close()
+
+
+# ============================================================================
+# CPU/RSS por processo (/proc)
+# ============================================================================
+
+def _ler_stat(pid):
+    """(ppid, ticks de CPU, RSS em bytes) ou None se o processo já saiu"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            campos = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/statm") as f:
+            rss = int(f.read().split()[1]) * _PAGINA
+    except (OSError, IndexError, ValueError):
+        return None
+    # Após o ")": estado(0) ppid(1) ... utime(11) stime(12)
+    return int(campos[1]), int(campos[11]) + int(campos[12]), rss
+
+
+def descendentes(pid_raiz):
+    """pid -> ppid de toda a árvore do servidor (workers do uvicorn e pools de extração)"""
+    pais = {}
+    for nome in os.listdir("/proc"):
+        if nome.isdigit():
+            stat = _ler_stat(int(nome))
+            if stat:
+                pais[int(nome)] = stat[0]
+
+    arvore = {pid_raiz: None}
+    mudou = True
+    while mudou:
+        mudou = False
+        for pid, ppid in pais.items():
+            if ppid in arvore and pid not in arvore:
+                arvore[pid] = ppid
+                mudou = True
+    return arvore
+
+
+class AmostradorRecursos(threading.Thread):
+    """Amostra CPU e RSS da árvore de processos do servidor durante a medição"""
+
+    def __init__(self, pid_raiz):
+        super().__init__(daemon=True)
+        self.pid_raiz = pid_raiz
+        self.parar = threading.Event()
+        self.processos = {}  # pid -> {"ppid", "cpu_inicial", "cpu_final", "rss_max"}
+
+    def amostrar(self):
+        for pid, ppid in descendentes(self.pid_raiz).items():
+            stat = _ler_stat(pid)
+            if not stat:
+                continue
+            p = self.processos.setdefault(pid, {"ppid": ppid, "cpu_inicial": stat[1], "rss_max": 0})
+            p["cpu_final"] = stat[1]
+            p["rss_max"] = max(p["rss_max"], stat[2])
+
+    def run(self):
+        while not self.parar.is_set():
+            self.amostrar()
+            self.parar.wait(INTERVALO_AMOSTRAGEM)
+
+    def resumo(self, duracao):
+        linhas = []
+        for pid, p in sorted(self.processos.items()):
+            papel = "master" if pid == self.pid_raiz else ("worker" if p["ppid"] == self.pid_raiz else "pool")
+            cpu = (p["cpu_final"] - p["cpu_inicial"]) / _TICKS
+            linhas.append({
+                "pid": pid,
+                "papel": papel,
+                "cpu_s": round(cpu, 2),
+                "cpu_pct": round(100 * cpu / duracao, 1) if duracao else 0.0,
+                "rss_max_mb": round(p["rss_max"] / 1024 / 1024, 1)
+            })
+        return linhas
+
+
+# ============================================================================
+# Geração de carga
+# ============================================================================
+
+def executar_carga(porta, endpoint, corpos, concorrencia, taxa, duracao, poisson=False):
+    """
+    Reenvia o corpus por `duracao` segundos e devolve [(latência, status)].
+    taxa=None: laço fechado (cada um dos `concorrencia` clientes dispara assim que recebe).
+    taxa=N: laço aberto a N req/s; a latência conta desde o instante agendado, então
+    a fila formada quando o servidor não acompanha aparece nos percentis.
+    """
+    resultados = []
+    lock = threading.Lock()
+    fim = time.monotonic() + duracao
+
+    def disparar(agendado, corpo, content_type):
+        try:
+            status = requisitar(porta, "POST", endpoint, corpo, content_type)[0]
+        except Exception as e:
+            status = type(e).__name__
+        with lock:
+            resultados.append((time.monotonic() - agendado, status))
+
+    if taxa is None:
+        def cliente(indice):
+            i = indice
+            while time.monotonic() < fim:
+                disparar(time.monotonic(), *corpos[i % len(corpos)])
+                i += concorrencia
+
+        with ThreadPoolExecutor(max_workers=concorrencia) as pool:
+            list(pool.map(cliente, range(concorrencia)))
+        return resultados
+
+    with ThreadPoolExecutor(max_workers=concorrencia) as pool:
+        proximo = time.monotonic()
+        i = 0
+        while proximo < fim:
+            espera = proximo - time.monotonic()
+            if espera > 0:
+                time.sleep(espera)
+            pool.submit(disparar, proximo, *corpos[i % len(corpos)])
+            i += 1
+            proximo += random.expovariate(taxa) if poisson else 1 / taxa
+
+    return resultados
+
+
+def percentil(ordenados, p):
+    if not ordenados:
+        return 0.0
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def resumir(nome, resultados, duracao, recursos):
+    latencias = sorted(lat for lat, _ in resultados)
+    status = Counter(str(s) for _, s in resultados)
+    erros = sum(n for s, n in status.items() if s != "200")
+
+    return {
+        "config": nome,
+        "requisicoes": len(resultados),
+        "vazao_rps": round(len(resultados) / duracao, 2) if duracao else 0.0,
+        "taxa_erro": round(erros / len(resultados), 4) if resultados else 0.0,
+        "status": dict(status),
+        "latencia_ms": {
+            **{f"p{p}": round(percentil(latencias, p) * 1000, 1) for p in PERCENTIS},
+            "max": round(latencias[-1] * 1000, 1) if latencias else 0.0
+        },
+        "processos": recursos
+    }
+
+
+def medir_configuracao(nome, ambiente, corpus, args):
+    corpos = [corpo_multipart(n, c) for n, c in corpus]
+
+    with Servidor(args.workers_servidor, ambiente) as servidor:
+        # Aquecimento: imports, pools e caches sobem antes da medição
+        if args.aquecimento > 0:
+            executar_carga(servidor.porta, args.endpoint, corpos, args.concorrencia, None, args.aquecimento)
+
+        amostrador = AmostradorRecursos(servidor.processo.pid)
+        amostrador.amostrar()
+        amostrador.start()
+
+        inicio = time.monotonic()
+        resultados = executar_carga(servidor.porta, args.endpoint, corpos, args.concorrencia,
+                                    args.taxa, args.duracao, args.poisson)
+        duracao = time.monotonic() - inicio
+
+        amostrador.parar.set()
+        amostrador.join()
+        amostrador.amostrar()
+
+    return resumir(nome, resultados, duracao, amostrador.resumo(duracao))
+
+
+# ============================================================================
+# Relatório
+# ============================================================================
+
+def imprimir_resumo(r):
+    lat = r["latencia_ms"]
+    print(f"\n=== {r['config']} ===")
+    print(f"Requisições: {r['requisicoes']} | Vazão: {r['vazao_rps']} req/s | Erros: {r['taxa_erro']:.2%} {r['status']}")
+    print("Latência (ms): " + " | ".join(f"{k} {v}" for k, v in lat.items()))
+    print(f"{'pid':>8} {'papel':<7} {'CPU s':>8} {'CPU %':>7} {'RSS máx MB':>11}")
+    for p in r["processos"]:
+        print(f"{p['pid']:>8} {p['papel']:<7} {p['cpu_s']:>8} {p['cpu_pct']:>7} {p['rss_max_mb']:>11}")
+
+
+def imprimir_comparacao(resumos):
+    print(f"\n{'config':<24} {'req/s':>8} {'erro %':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'CPU %':>7} {'RSS MB':>8}")
+    for r in resumos:
+        cpu = sum(p["cpu_pct"] for p in r["processos"])
+        rss = sum(p["rss_max_mb"] for p in r["processos"])
+        lat = r["latencia_ms"]
+        print(f"{r['config']:<24} {r['vazao_rps']:>8} {r['taxa_erro'] * 100:>7.2f} "
+              f"{lat['p50']:>8} {lat['p95']:>8} {lat['p99']:>8} {cpu:>7.1f} {rss:>8.1f}")
+
+
+def interpretar_config(texto):
+    """"nome:VAR=valor,VAR=valor" -> (nome, {VAR: valor})"""
+    nome, _, pares = texto.partition(":")
+    ambiente = {}
+    for par in filter(None, pares.split(",")):
+        chave, sep, valor = par.partition("=")
+        if not sep:
+            raise ValueError(f"Configuração inválida: {par!r} (esperado VAR=valor)")
+        ambiente[chave.strip()] = valor.strip()
+    return nome, ambiente
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga local do app (uvicorn + corpus de PDFs)")
+    parser.add_argument("corpus", nargs="*", help="PDFs ou pastas (padrão: PDFs de exemplo do repositório)")
+    parser.add_argument("--endpoint", default=ENDPOINT_PADRAO)
+    parser.add_argument("--concorrencia", type=int, default=CONCORRENCIA_PADRAO, help="Requisições simultâneas")
+    parser.add_argument("--taxa", type=float, default=None,
+                        help="Chegadas por segundo (laço aberto); sem ela, laço fechado")
+    parser.add_argument("--poisson", action="store_true", help="Intervalos exponenciais em vez de fixos")
+    parser.add_argument("--duracao", type=float, default=DURACAO_PADRAO, help="Segundos medidos por configuração")
+    parser.add_argument("--aquecimento", type=float, default=AQUECIMENTO_PADRAO, help="Segundos descartados")
+    parser.add_argument("--workers-servidor", type=int, default=1, help="--workers do uvicorn")
+    parser.add_argument("--config", action="append", default=[],
+                        help='Configuração a comparar: "nome:VAR=valor,..." (ex.: '
+                             '"thread:TIPO_EXECUTOR=thread", "sem-cache:LIMITE_CACHE_PAGINAS_MB=0"). Repetível')
+    parser.add_argument("--saida", help="JSON com os resumos de todas as configurações")
+    args = parser.parse_args()
+
+    corpus = carregar_corpus(args.corpus)
+    if not corpus:
+        parser.error("Nenhum PDF no corpus")
+
+    configs = [interpretar_config(c) for c in args.config] or [("padrao", {})]
+    print(f"Corpus: {len(corpus)} PDFs | concorrência {args.concorrencia} | "
+          f"{f'{args.taxa} req/s' if args.taxa else 'laço fechado'} | {args.duracao:.0f}s por configuração")
+
+    resumos = []
+    for nome, ambiente in configs:
+        resumo = medir_configuracao(nome, ambiente, corpus, args)
+        imprimir_resumo(resumo)
+        resumos.append(resumo)
+
+    if len(resumos) > 1:
+        imprimir_comparacao(resumos)
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(resumos, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
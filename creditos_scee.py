@@ -0,0 +1,361 @@
+import os
+import sqlite3
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+# Entradas mensais por UC (o estado do livro é derivado delas); compartilhado entre
+# os workers da API, a ingestão, o teste.py e o reprocessamento do armazém
+ARQUIVO_CREDITOS = os.getenv("ARQUIVO_CREDITOS_SCEE", "creditos_scee.db")
+
+# Créditos de energia do SCEE valem 60 meses a partir do mês em que foram gerados
+VALIDADE_CREDITOS_MESES = 60
+
+# Diferença (kWh) entre o saldo a expirar informado pela Copel e o projetado pelo
+# livro a partir da qual o mês é marcado como divergente
+TOLERANCIA_EXPIRAR_KWH = 1.0
+
+
+def mes_para_indice(mes):
+    # "MM/AAAA" -> meses desde o ano 0 (ordenável, aritmética simples)
+    m, a = mes.split("/")
+    return int(a) * 12 + int(m) - 1
+
+
+def indice_para_mes(indice):
+    return f"{indice % 12 + 1:02d}/{indice // 12}"
+
+
+def _saldos_scee(scee):
+    """(saldo do mês, saldo acumulado) somando ponta + fora ponta quando só vêm discriminados"""
+    saldo_mes = scee["saldo_mes_kwh"]
+    acumulado = scee["saldo_acumulado_kwh"]
+
+    periodos = scee.get("detalhamento_periodos")
+    if periodos:
+        saldo_mes = saldo_mes or periodos["saldo_mes_ponta"] + periodos["saldo_mes_fora_ponta"]
+        acumulado = acumulado or periodos["saldo_acum_ponta"] + periodos["saldo_acum_fora_ponta"]
+
+    return saldo_mes, acumulado
+
+
+def _injecao(dados):
+    """(kWh injetado, crédito gerado no mês) pela analise_energia_solar ou, sem ela, pelos itens (mesma conta)"""
+    analise = dados.get("analise_energia_solar")
+    if analise:
+        return analise["total_injetado_kwh"], analise["creditos_gerados_kwh"]
+
+    itens = dados.get("itens") or []
+    inj = sum(abs(i["quantidade"]) for i in itens if i["tipo"] == "INJETADA")
+    cons = sum(i["quantidade"] for i in itens if i["tipo"] == "TE" and i["quantidade"] > 0)
+    return inj, max(inj - cons, 0) if cons > 0 else inj
+
+
+class _HistoricoUC:
+    """
+    Meses de uma UC em ordem (lista ordenada + bisect) com o estado do livro após cada mês.
+    O estado guarda os lotes de crédito ainda válidos (mês de geração, kWh), consumidos FIFO.
+    """
+
+    def __init__(self, versao=0):
+        self.meses = []
+        self.entradas = []
+        self.estados = []
+        # Versão da UC no banco (versoes_uc) de que este histórico foi calculado
+        self.versao = versao
+
+    def inserir(self, indice, entrada):
+        """Grava a entrada do mês e devolve a posição a partir da qual o livro muda"""
+        pos = bisect_left(self.meses, indice)
+
+        if pos < len(self.meses) and self.meses[pos] == indice:
+            self.entradas[pos] = entrada
+        else:
+            self.meses.insert(pos, indice)
+            self.entradas.insert(pos, entrada)
+            self.estados.insert(pos, None)
+
+        return pos
+
+    def recalcular(self, pos):
+        """
+        Recalcula os estados a partir de pos. Para assim que um estado recalculado
+        coincide com o já gravado: daí em diante nada mudou (chegada tardia que
+        não altera o saldo não reprocessa o resto do histórico).
+        """
+        lotes = list(self.estados[pos - 1]["lotes"]) if pos > 0 else []
+        recalculados = 0
+
+        for j in range(pos, len(self.meses)):
+            indice = self.meses[j]
+            entrada = self.entradas[j]
+
+            # 1. Expira lotes com mais de 60 meses
+            expirado = sum(kwh for mes_geracao, kwh in lotes if mes_geracao + VALIDADE_CREDITOS_MESES <= indice)
+            lotes = [(g, kwh) for g, kwh in lotes if g + VALIDADE_CREDITOS_MESES > indice]
+
+            # 2. Crédito gerado no mês vira um lote novo
+            if entrada["gerado_kwh"] > 0:
+                lotes.append((indice, entrada["gerado_kwh"]))
+
+            # 3. Consumo de créditos: inferido do saldo informado pela Copel (mais antigos primeiro)
+            saldo = sum(kwh for _, kwh in lotes)
+            informado = entrada["saldo_informado_kwh"]
+            consumido = max(saldo - informado, 0) if informado is not None else 0.0
+
+            # Saldo informado maior que o calculado: faltam meses anteriores no livro.
+            # A diferença entra como lote mais antigo (consumido primeiro), datado deste mês
+            ajuste = max(informado - saldo, 0) if informado is not None else 0.0
+            if ajuste:
+                lotes.insert(0, (indice, ajuste))
+
+            restante = consumido
+            while restante > 0 and lotes:
+                g, kwh = lotes[0]
+                if kwh <= restante:
+                    restante -= kwh
+                    lotes.pop(0)
+                else:
+                    lotes[0] = (g, kwh - restante)
+                    restante = 0
+
+            estado = {
+                "lotes": tuple(lotes),
+                "expirado_kwh": expirado,
+                "consumido_kwh": consumido,
+                "ajuste_kwh": ajuste,
+                "saldo_kwh": sum(kwh for _, kwh in lotes),
+                # Lotes que vencem no mês seguinte (comparável ao "saldo a expirar" da fatura)
+                "expirar_kwh": sum(kwh for g, kwh in lotes if g + VALIDADE_CREDITOS_MESES == indice + 1)
+            }
+
+            recalculados += 1
+            if j > pos and self.estados[j] == estado:
+                break
+            self.estados[j] = estado
+
+        return recalculados
+
+
+class LivroCreditosSCEE:
+    """
+    Livro de créditos SCEE por UC, alimentado por faturas em qualquer ordem.
+    Fatura atrasada só recalcula os meses a partir do mês dela (e para cedo se o saldo
+    não mudou). Beneficiárias também são indexadas pela UC geradora.
+
+    As entradas ficam num SQLite local (WAL, como o armazém); a memória só guarda o
+    histórico já calculado das UCs consultadas. Cada gravação incrementa a versão da
+    UC (versoes_uc): depois de um commit de outro processo (outro worker da API,
+    ingestão), só as UCs cuja versão mudou são recarregadas.
+    """
+
+    def __init__(self, caminho=ARQUIVO_CREDITOS):
+        self._lock = threading.Lock()
+        self._ucs = {}
+        # UCs em cache ainda não conferidas desde o último commit de outra conexão
+        self._a_conferir = set()
+        self.conn = sqlite3.connect(caminho, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS entradas (
+                uc TEXT,
+                mes INTEGER,
+                gerado_kwh REAL,
+                saldo_informado_kwh REAL,
+                saldo_expirar_informado_kwh REAL,
+                uc_geradora TEXT,
+                PRIMARY KEY (uc, mes)
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_entradas_geradora ON entradas (uc_geradora)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS versoes_uc (uc TEXT PRIMARY KEY, versao INTEGER)")
+        self.conn.commit()
+        self._versao_dados = self._data_version()
+
+    def _data_version(self):
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _versao_uc(self, uc):
+        linha = self.conn.execute("SELECT versao FROM versoes_uc WHERE uc = ?", (uc,)).fetchone()
+        return linha[0] if linha else 0
+
+    def _historico(self, uc):
+        """Histórico calculado da UC (None se a UC não tem entradas). Chamar com o lock"""
+        # data_version só muda com commits de outras conexões: as UCs em cache passam
+        # a ser conferidas, cada uma na próxima vez que for usada
+        versao = self._data_version()
+        if versao != self._versao_dados:
+            self._a_conferir = set(self._ucs)
+            self._versao_dados = versao
+
+        if uc in self._a_conferir:
+            self._a_conferir.discard(uc)
+            if self._ucs[uc].versao != self._versao_uc(uc):
+                del self._ucs[uc]
+
+        historico = self._ucs.get(uc)
+        if historico is None:
+            # Versão lida antes das entradas: gravação no meio só causa uma recarga a mais
+            versao_uc = self._versao_uc(uc)
+            linhas = self.conn.execute(
+                "SELECT mes, gerado_kwh, saldo_informado_kwh, saldo_expirar_informado_kwh, uc_geradora "
+                "FROM entradas WHERE uc = ? ORDER BY mes", (uc,)).fetchall()
+            if not linhas:
+                return None
+
+            historico = _HistoricoUC(versao_uc)
+            for mes, gerado, informado, expirar, uc_geradora in linhas:
+                historico.meses.append(mes)
+                historico.entradas.append({
+                    "gerado_kwh": gerado,
+                    "saldo_informado_kwh": informado,
+                    "saldo_expirar_informado_kwh": expirar,
+                    "uc_geradora": uc_geradora
+                })
+                historico.estados.append(None)
+            historico.recalcular(0)
+            self._ucs[uc] = historico
+
+        return historico
+
+    def fechar(self):
+        self.conn.close()
+
+    def registrar(self, dados):
+        """
+        Alimenta o livro com uma fatura (extract_all, com ou sem analise_energia_solar).
+        Devolve quantos meses foram recalculados (0 se a fatura não tem dados de GD).
+        """
+        uc = dados["cliente"].get("uc")
+        mes = dados["fatura"].get("mes_referencia")
+        scee = dados.get("solar_scee")
+
+        if scee:
+            injetado = None
+            gerado, informado = _saldos_scee(scee)
+        else:
+            # Sem bloco SCEE: o excedente de injeção do mês é o crédito gerado
+            injetado, gerado = _injecao(dados)
+            informado = None
+
+        if not uc or not mes or not (scee or injetado):
+            return 0
+
+        entrada = {
+            "gerado_kwh": gerado,
+            "saldo_informado_kwh": informado,
+            "saldo_expirar_informado_kwh": scee["saldo_expirar_kwh"] if scee else None,
+            "uc_geradora": scee.get("uc_geradora") if scee else None
+        }
+        indice = mes_para_indice(mes)
+
+        with self._lock:
+            # BEGIN IMMEDIATE: conferência da versão da UC e gravação sem outro processo no meio
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                historico = self._historico(uc)
+
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO entradas VALUES (?, ?, ?, ?, ?, ?)",
+                    (uc, indice, entrada["gerado_kwh"], entrada["saldo_informado_kwh"],
+                     entrada["saldo_expirar_informado_kwh"], entrada["uc_geradora"]))
+                self.conn.execute(
+                    "INSERT INTO versoes_uc VALUES (?, 1) ON CONFLICT (uc) DO UPDATE SET versao = versao + 1", (uc,))
+                versao_uc = self._versao_uc(uc)
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+
+            if historico is None:
+                return len(self._historico(uc).meses)
+
+            historico.versao = versao_uc
+            return historico.recalcular(historico.inserir(indice, entrada))
+
+    def extrato(self, uc):
+        """Movimentação mês a mês da UC"""
+        with self._lock:
+            historico = self._historico(uc)
+            if not historico:
+                return []
+
+            return [
+                {
+                    "mes_referencia": indice_para_mes(indice),
+                    "gerado_kwh": round(entrada["gerado_kwh"], 2),
+                    "consumido_kwh": round(estado["consumido_kwh"], 2),
+                    "expirado_kwh": round(estado["expirado_kwh"], 2),
+                    "ajuste_kwh": round(estado["ajuste_kwh"], 2),
+                    "saldo_kwh": round(estado["saldo_kwh"], 2),
+                    "saldo_informado_kwh": entrada["saldo_informado_kwh"],
+                    "expirar_proximo_mes_kwh": round(estado["expirar_kwh"], 2),
+                    "saldo_expirar_informado_kwh": entrada["saldo_expirar_informado_kwh"],
+                    "expiracao_divergente": _expiracao_divergente(entrada, estado)
+                }
+                for indice, entrada, estado in zip(historico.meses, historico.entradas, historico.estados)
+            ]
+
+    def saldo(self, uc, mes=None):
+        """Saldo da UC no mês (ou no último mês conhecido)"""
+        with self._lock:
+            historico = self._historico(uc)
+            if not historico:
+                return 0.0
+
+            if mes is None:
+                return historico.estados[-1]["saldo_kwh"]
+
+            # Último mês registrado até o mês pedido
+            pos = bisect_left(historico.meses, mes_para_indice(mes) + 1) - 1
+            return historico.estados[pos]["saldo_kwh"] if pos >= 0 else 0.0
+
+    def projecao_expiracao(self, uc, meses=12):
+        """
+        Créditos que expiram nos próximos `meses` a partir do último mês conhecido,
+        supondo que não haja novo consumo (lotes do estado atual + 60 meses).
+        O primeiro mês traz também o saldo a expirar informado pela Copel na última fatura.
+        """
+        with self._lock:
+            historico = self._historico(uc)
+            if not historico:
+                return []
+
+            ultimo = historico.meses[-1]
+            entrada, estado = historico.entradas[-1], historico.estados[-1]
+
+        por_mes = defaultdict(float)
+        for mes_geracao, kwh in estado["lotes"]:
+            vencimento = mes_geracao + VALIDADE_CREDITOS_MESES
+            if vencimento <= ultimo + meses:
+                por_mes[vencimento] += kwh
+
+        projecao = [{"mes_referencia": indice_para_mes(m), "expira_kwh": round(kwh, 2)}
+                    for m, kwh in sorted(por_mes.items())]
+
+        # Saldo a expirar da fatura vale para o mês seguinte ao último conhecido
+        informado = entrada["saldo_expirar_informado_kwh"]
+        if informado and meses >= 1:
+            seguinte = {"mes_referencia": indice_para_mes(ultimo + 1), "expira_kwh": 0.0}
+            if not projecao or projecao[0]["mes_referencia"] != seguinte["mes_referencia"]:
+                projecao.insert(0, seguinte)
+            projecao[0]["expira_informado_kwh"] = informado
+            projecao[0]["divergente"] = _expiracao_divergente(entrada, estado)
+
+        return projecao
+
+    def saldo_por_geradora(self, uc_geradora, mes=None):
+        """Saldo somado das beneficiárias de uma UC geradora"""
+        with self._lock:
+            beneficiarias = [uc for uc, in self.conn.execute(
+                "SELECT DISTINCT uc FROM entradas WHERE uc_geradora = ?", (uc_geradora,))]
+        return sum(self.saldo(uc, mes) for uc in beneficiarias)
+
+
+def _expiracao_divergente(entrada, estado):
+    """
+    Saldo a expirar informado pela Copel difere do que o livro projeta para o mês seguinte.
+    Só compara quando a fatura traz o valor (o extract_saldos_gd devolve 0.0 sem o campo)
+    """
+    informado = entrada["saldo_expirar_informado_kwh"]
+    return bool(informado) and abs(informado - estado["expirar_kwh"]) > TOLERANCIA_EXPIRAR_KWH
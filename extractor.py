@@ -1,4 +1,127 @@
 import re
+import time
+from functools import lru_cache
+
+# Classificação do tipo de item faturado: (tipo, termos) em ordem de prioridade.
+# Termos casam com palavras inteiras da descrição ("IP" não casa em "MUNICIPIO");
+# "*" no fim indica prefixo de palavra ("INJ*" casa INJ., INJETADA; "GD*" casa GDI);
+# espaço no fim exige outra palavra depois: "TE " não casa o TE final de
+# "ENERGIA INJ. BAND. AMARELA TE" (crédito de bandeira, INJETADA), mas casa "... TE P1"
+REGRAS_TIPO_ITEM = [
+    ("TUSD", ["USO SISTEMA", "TUSD"]),
+    ("TE", ["CONSUMO*", "TE "]),
+    ("INJETADA", ["INJETADA", "COMPENSADA", "GD*", "INJ*"]),
+    ("IP", ["ILUMIN*", "COSIP", "IP"]),
+    ("FINANCEIRO", ["MULTA*", "JUROS", "MORA*", "PARCEL*", "ACRES*"]),
+    ("BANDEIRA", ["BAND*", "AMARELA", "VERMELHA", "TRIB DIF"]),
+    ("DEMANDA", ["DEMANDA*"]),
+]
+
+
+def _compilar_termos(termos):
+    partes = []
+    for termo in termos:
+        seguido = termo.endswith(" ")
+        termo = termo.strip()
+        prefixo = termo.endswith("*")
+        partes.append(r"\s+".join(map(re.escape, termo.rstrip("*").split())) + (r"[A-Z0-9]*" if prefixo else "") +
+                      (r"(?=\s+\S)" if seguido else ""))
+    return re.compile(r"(?<![A-Z0-9])(?:" + "|".join(partes) + r")(?![A-Z0-9])")
+
+
+_REGRAS_TIPO_COMPILADAS = [(tipo, _compilar_termos(termos)) for tipo, termos in REGRAS_TIPO_ITEM]
+
+
+# Seções do extract_all (na ordem de saída) e de quais outras cada uma depende
+SECOES = [
+    "cliente", "fatura", "itens", "medicoes", "historico", "tributos",
+    "solar_scee", "avisos_debitos", "tecnico", "bandeiras"
+]
+DEPENDENCIAS_SECOES = {
+    "avisos_debitos": ["fatura"]
+}
+
+# Método extract_* responsável por cada seção (a limpeza do logradouro no extract_all
+# conta como parte de extract_cliente_info)
+EXTRATORES_SECOES = {
+    "cliente": "extract_cliente_info",
+    "fatura": "extract_fatura_dados",
+    "itens": "extract_itens_detalhado",
+    "medicoes": "extract_medicoes",
+    "historico": "extract_historico",
+    "tributos": "extract_tributos_resumo",
+    "solar_scee": "extract_saldos_gd",
+    "avisos_debitos": "extract_avisos_e_debitos",
+    "tecnico": "extract_dados_tecnicos",
+    "bandeiras": "extract_bandeiras"
+}
+
+
+# Ordem de execução: seções das quais outras dependem vêm primeiro
+_DEPENDIDAS = {d for deps in DEPENDENCIAS_SECOES.values() for d in deps}
+ORDEM_EXECUCAO = sorted(SECOES, key=lambda s: s not in _DEPENDIDAS)
+
+
+def executar_isolado(secao, funcao, status, dependencias_com_erro=()):
+    """
+    Roda funcao() como seção isolada e cronometrada: registra em status[secao]
+    "ok", "degradado" (rodou, mas alguma dependência falhou) ou "erro" (devolve None).
+    """
+    inicio = time.perf_counter()
+    try:
+        resultado = funcao()
+        status[secao] = {"status": "degradado" if dependencias_com_erro else "ok"}
+    except Exception as e:
+        resultado = None
+        status[secao] = {"status": "erro", "erro": f"{type(e).__name__}: {e}"}
+
+    status[secao]["tempo_ms"] = round((time.perf_counter() - inicio) * 1000, 2)
+    if dependencias_com_erro:
+        status[secao]["dependencias_com_erro"] = list(dependencias_com_erro)
+    return resultado
+
+
+def secoes_a_retentar(status):
+    """Seções com erro ou degradadas, na ordem de SECOES"""
+    return [s for s in SECOES if status.get(s, {}).get("status") in ("erro", "degradado")]
+
+
+def versao(n):
+    """
+    Marca a versão de um extract_*. Incremente junto com cada CORREÇÃO #n do método:
+    o reprocessamento (armazem_faturas.py) refaz só as seções cuja versão mudou.
+    """
+    def marcar(metodo):
+        metodo.versao = n
+        return metodo
+    return marcar
+
+# Conversão de número BR ("1.234,56", "R$ -7,21"): remove espaço/sinal/milhar e troca a vírgula
+# numa única passada de translate; valores repetidos (tarifas como 0,382519) vêm do cache
+_TABELA_NUMERO_BR = str.maketrans({" ": None, "-": None, ".": None, ",": "."})
+
+
+@lru_cache(maxsize=8192)
+def _br_para_float(v):
+    if "R$" in v:
+        v = v.replace("R$", "")
+    # Suporte para sinal de menos (Solar/Créditos)
+    sinal = -1 if "-" in v else 1
+    try:
+        return float(v.translate(_TABELA_NUMERO_BR)) * sinal
+    except ValueError:
+        return 0.0
+
+
+@lru_cache(maxsize=4096)
+def _classificar_tipo_item(desc):
+    # Cache pela descrição crua: as descrições se repetem literalmente entre faturas,
+    # então o acerto não paga nenhuma normalização
+    desc = desc.upper()
+    for tipo, regex in _REGRAS_TIPO_COMPILADAS:
+        if regex.search(desc):
+            return tipo
+    return "OUTROS"
 
 
 class CopelExtractor:
@@ -21,14 +144,24 @@ class CopelExtractor:
     def br_money_to_float(self, v):
         if not v:
             return 0.0
-        v = str(v).replace("R$", "").replace(" ", "")
-        # Suporte para sinal de menos (Solar/Créditos)
-        sinal = -1 if "-" in v else 1
-        v = v.replace("-", "").replace(".", "").replace(",", ".")
-        try:
-            return float(v) * sinal
-        except:
-            return 0.0
+        return _br_para_float(v if isinstance(v, str) else str(v))
+
+    def br_money_list_to_float(self, valores):
+        """Converte uma lista de tokens numéricos BR de uma vez"""
+        return [_br_para_float(v if isinstance(v, str) else str(v)) if v else 0.0 for v in valores]
+
+    def classify_item(self, desc):
+        """Tipo do item (TE, TUSD, INJETADA...) pela tabela REGRAS_TIPO_ITEM"""
+        return _classificar_tipo_item(desc)
+
+    def classify_scee(self, text):
+        """GERADORA, BENEFICIARIA ou None (UC fora do SCEE)"""
+        txt = self.normalize(text).upper()
+        if "MICRO/MINIGERADORA NO SCEE" in txt:
+            return "GERADORA"
+        if "BENEFICIARIA SCEE" in txt or "UC BENEFICIARIA" in txt:
+            return "BENEFICIARIA"
+        return None
 
     def safe_search(self, pattern, text, group=1):
         if not text:
@@ -36,12 +169,68 @@ class CopelExtractor:
         m = re.search(pattern, text, re.IGNORECASE | re.DOTALL)
         return self.normalize(m.group(group)) if m else None
 
-    def extract_all(self, text):
-        fatura = self.extract_fatura_dados(text)
-        cliente = self.extract_cliente_info(text)
+    def extract_all(self, text, secoes=None):
+        """
+        Extração completa. secoes = subconjunto de SECOES (None = todas): as seções
+        não pedidas nem são processadas, exceto quando outra pedida depende delas.
+        Exceção em qualquer seção interrompe tudo (ver extract_secoes).
+        """
+        return self._extrair(text, secoes)[0]
+
+    def extract_secoes(self, text, secoes=None, anteriores=None):
+        """
+        Como o extract_all, mas cada seção roda isolada e cronometrada: devolve
+        (dados, status), com None nas seções que falharam e status por seção
+        (ver executar_isolado). anteriores = dados de uma extração anterior: as
+        dependências já extraídas são reaproveitadas, então dá para refazer só
+        secoes_a_retentar(status), por exemplo sobre o texto do OCR.
+        """
+        return self._extrair(text, secoes, anteriores, isolar=True)
+
+    def _extrair(self, text, secoes=None, anteriores=None, isolar=False):
+        pedidas = set(SECOES if secoes is None else secoes)
+        desconhecidas = pedidas - set(SECOES)
+        if desconhecidas:
+            raise ValueError(f"Seções desconhecidas: {', '.join(sorted(desconhecidas))}")
+
+        dependencias = {d for s in pedidas for d in DEPENDENCIAS_SECOES.get(s, [])} - pedidas
+        extratores = self._extratores(text)
+        dados, status = {}, {}
+
+        for secao in ORDEM_EXECUCAO:
+            if secao not in pedidas and secao not in dependencias:
+                continue
+
+            if secao in dependencias and anteriores and anteriores.get(secao) is not None:
+                dados[secao] = anteriores[secao]
+            elif isolar:
+                falhas = [d for d in DEPENDENCIAS_SECOES.get(secao, []) if status.get(d, {}).get("status") == "erro"]
+                dados[secao] = executar_isolado(secao, lambda: extratores[secao](dados), status, falhas)
+            else:
+                dados[secao] = extratores[secao](dados)
+
+        return ({secao: dados[secao] for secao in SECOES if secao in pedidas},
+                {secao: status[secao] for secao in SECOES if secao in status})
+
+    def _extratores(self, text):
+        """Função de cada seção; recebe as seções já extraídas (dependências)"""
+        return {
+            "cliente": lambda d: self._limpar_logradouro(self.extract_cliente_info(text)),
+            "fatura": lambda d: self.extract_fatura_dados(text),
+            "itens": lambda d: self.extract_itens_detalhado(text),
+            "medicoes": lambda d: self.extract_medicoes(text),
+            "historico": lambda d: self.extract_historico(text),
+            "tributos": lambda d: self.extract_tributos_resumo(text),
+            "solar_scee": lambda d: self.extract_saldos_gd(text),
+            "avisos_debitos": lambda d: self.extract_avisos_e_debitos(text, (d["fatura"] or {}).get("mes_referencia"),
+                                                                      (d["fatura"] or {}).get("vencimento")),
+            "tecnico": lambda d: self.extract_dados_tecnicos(text),
+            "bandeiras": lambda d: self.extract_bandeiras(text)
+        }
 
+    def _limpar_logradouro(self, cliente):
         # CORREÇÃO #2 E ATENÇÃO A: Limpeza inteligente de UC no logradouro
-        if cliente['endereco']['logradouro']:
+        if cliente and cliente['endereco']['logradouro']:
             logradouro = cliente['endereco']['logradouro']
 
             # Estratégia 1: Remove UC específica se identificada (apenas quando isolada)
@@ -59,20 +248,56 @@ class CopelExtractor:
             # Normaliza espaços múltiplos
             cliente['endereco']['logradouro'] = re.sub(r'\s+', ' ', logradouro).strip()
 
-        return {
-            "cliente": cliente,
-            "fatura": fatura,
-            "itens": self.extract_itens_detalhado(text),
-            "medicoes": self.extract_medicoes(text),
-            "historico": self.extract_historico(text),
-            "tributos": self.extract_tributos_resumo(text),
-            "solar_scee": self.extract_saldos_gd(text),
-            "avisos_debitos": self.extract_avisos_e_debitos(text, fatura.get("mes_referencia"),
-                                                            fatura.get("vencimento")),
-            "tecnico": self.extract_dados_tecnicos(text),
-            "bandeiras": self.extract_bandeiras(text)
-        }
-
+        return cliente
+
+    def versoes_secoes(self, secoes=None):
+        """
+        Versões em vigor por seção: a do próprio extract_* mais as das seções de que
+        ela depende (itens muda também quando extract_fatura_dados muda).
+        """
+        versoes = {}
+        for secao in SECOES if secoes is None else secoes:
+            metodos = [EXTRATORES_SECOES[s] for s in [secao] + DEPENDENCIAS_SECOES.get(secao, [])]
+            versoes[secao] = {m: getattr(self, m).versao for m in metodos}
+        return versoes
+
+    def split_invoices(self, pages):
+        """
+        Separa um PDF agrupado (várias UCs em sequência) em um texto por fatura.
+        Recebe um iterável com o texto de cada página e gera os blocos conforme
+        as fronteiras aparecem, sem precisar do documento inteiro em memória.
+        """
+        atual = []
+        chave_atual = None
+        uc_atual = None
+
+        for page in pages:
+            # Fronteiras: nova chave de acesso ou novo box UNIDADE CONSUMIDORA
+            chave = re.sub(r"\s+", "", self.safe_search(r"Chave\s*de\s*Acesso\s*([\d\s]{44,55})", page) or "")
+            chave = chave if len(chave) == 44 else None
+
+            box_uc = self.safe_search(r"UNIDADE\s*CONS[UÚ]MIDORA[\s\n]+([\d\s\n]{7,15})", page)
+            uc = re.sub(r"\D", "", box_uc) if box_uc else None
+
+            # Páginas sem chave/UC (verso, continuação) pertencem à fatura corrente;
+            # a primeira chave/UC encontrada "adota" as páginas anteriores (capa)
+            nova_fatura = atual and (
+                (chave and chave_atual and chave != chave_atual) or
+                (uc and uc_atual and uc != uc_atual)
+            )
+
+            if nova_fatura:
+                yield "\n".join(atual)
+                atual, chave_atual, uc_atual = [], None, None
+
+            atual.append(page)
+            chave_atual = chave_atual or chave
+            uc_atual = uc_atual or uc
+
+        if atual:
+            yield "\n".join(atual)
+
+    @versao(1)
     def extract_cliente_info(self, text):
         # CORREÇÃO #1: Extração de UC melhorada
         # Estratégia 1: Box UNIDADE CONSUMIDORA com variações de encoding
@@ -120,6 +345,7 @@ class CopelExtractor:
             }
         }
 
+    @versao(1)
     def extract_fatura_dados(self, text):
         # Padrão principal: MES/ANO VENCIMENTO VALOR
         fin = re.search(r"(\d{2}/20\d{2})\s+(\d{2}/\d{2}/20\d{2})\s+R\$\s*([\d\.,\s-]+)", text)
@@ -157,6 +383,7 @@ class CopelExtractor:
                 text)
         }
 
+    @versao(3)
     def extract_itens_detalhado(self, text):
         itens = []
 
@@ -215,95 +442,83 @@ class CopelExtractor:
             if len(nums) < 2:
                 continue
 
-            try:
-                # Determina tipo de item
-                tipo = "OUTROS"
-                if "USO SISTEMA" in desc or "TUSD" in desc:
-                    tipo = "TUSD"
-                elif "CONSUMO" in desc or " TE " in desc or "ELET CONSUMO" in desc:
-                    tipo = "TE"
-                elif any(x in desc for x in ["INJETADA", "COMPENSADA", "GD", "INJ"]):
-                    tipo = "INJETADA"
-                elif "ILUMIN" in desc or "COSIP" in desc or "IP" in desc:
-                    tipo = "IP"
-                elif any(x in desc for x in ["MULTA", "JUROS", "MORA", "PARCEL", "ACRES"]):
-                    tipo = "FINANCEIRO"
-                elif "BAND" in desc or "AMARELA" in desc or "VERMELHA" in desc or "TRIB DIF" in desc:
-                    tipo = "BANDEIRA"
-                elif "DEMANDA" in desc:
-                    tipo = "DEMANDA"
-
-                # CORREÇÃO #3: Extração correta de valores
-                # Padrão típico da linha Copel:
-                # ENERGIA ELET CONSUMO kWh 266 0,382519 101,75 5,23 19,33 0,290190
-                #                          [0]    [1]     [2]   [3]  [4]    [5]
-
-                quantidade = self.br_money_to_float(nums[0])
-
-                # Para itens financeiros sem quantidade (multa, juros)
-                if tipo == "FINANCEIRO" and "UN" in line_original and quantidade == 1:
-                    tarifa = self.br_money_to_float(nums[1]) if len(nums) >= 2 else 0.0
+            # Determina tipo de item (tabela REGRAS_TIPO_ITEM, com cache)
+            tipo = self.classify_item(desc)
+
+            # CORREÇÃO #3: Extração correta de valores
+            # Padrão típico da linha Copel:
+            # ENERGIA ELET CONSUMO kWh 266 0,382519 101,75 5,23 19,33 0,290190
+            #                          [0]    [1]     [2]   [3]  [4]    [5]
+
+            # Converte todos os números da linha de uma vez (token inválido vira 0.0).
+            # Sem try/except por linha: erro inesperado aqui aparece como falha da
+            # seção itens no extract_secoes, em vez de descartar a linha em silêncio
+            valores = self.br_money_list_to_float(nums)
+            quantidade = valores[0]
+
+            # Para itens financeiros sem quantidade (multa, juros)
+            if tipo == "FINANCEIRO" and "UN" in line_original and quantidade == 1:
+                tarifa = valores[1] if len(nums) >= 2 else 0.0
+                valor_total = tarifa
+                icms = 0.0
+            # Para itens de energia (TE, TUSD, BANDEIRA, INJETADA)
+            elif tipo in ["TE", "TUSD", "BANDEIRA", "INJETADA"]:
+                # Padrão: qtd, tarifa, VALOR_TOTAL, icms, outros...
+                tarifa = valores[1] if len(nums) >= 2 else 0.0
+                valor_total = valores[2] if len(nums) >= 3 else 0.0
+                icms = valores[3] if len(nums) >= 4 else 0.0
+            # Para IP (iluminação pública)
+            elif tipo == "IP":
+                # Padrão: UN 1 25,780000 25,78
+                if "UN" in line_original:
+                    quantidade = 1
+                    tarifa = valores[-1]
                     valor_total = tarifa
                     icms = 0.0
-                # Para itens de energia (TE, TUSD, BANDEIRA, INJETADA)
-                elif tipo in ["TE", "TUSD", "BANDEIRA", "INJETADA"]:
-                    # Padrão: qtd, tarifa, VALOR_TOTAL, icms, outros...
-                    tarifa = self.br_money_to_float(nums[1]) if len(nums) >= 2 else 0.0
-                    valor_total = self.br_money_to_float(nums[2]) if len(nums) >= 3 else 0.0
-                    icms = self.br_money_to_float(nums[3]) if len(nums) >= 4 else 0.0
-                # Para IP (iluminação pública)
-                elif tipo == "IP":
-                    # Padrão: UN 1 25,780000 25,78
-                    if "UN" in line_original:
-                        quantidade = 1
-                        tarifa = self.br_money_to_float(nums[-1])
-                        valor_total = tarifa
-                        icms = 0.0
-                    else:
-                        tarifa = self.br_money_to_float(nums[1]) if len(nums) >= 2 else 0.0
-                        valor_total = self.br_money_to_float(nums[2]) if len(nums) >= 3 else 0.0
-                        icms = 0.0
                 else:
-                    # Fallback para outros tipos
-                    tarifa = self.br_money_to_float(nums[1]) if len(nums) >= 2 else 0.0
-                    valor_total = self.br_money_to_float(nums[-1])
+                    tarifa = valores[1] if len(nums) >= 2 else 0.0
+                    valor_total = valores[2] if len(nums) >= 3 else 0.0
                     icms = 0.0
-
-                # Validação: descarta itens com valores absurdos (indicativo de parsing errado)
-                # Para ENERGIA: Tarifa não pode ser > 10 reais por kWh (proteção contra anos/datas)
-                # Para FINANCEIRO: Permite valores até R$ 10.000 (parcelamentos, multas grandes)
-                # Quantidade: não pode ser > 100000 kWh (consumo residencial típico < 2000)
-
-                if tipo in ['TE', 'TUSD', 'INJETADA', 'BANDEIRA']:
-                    # Energia: tarifa máxima R$ 10/kWh
-                    if abs(tarifa) > 10:
-                        continue
-                elif tipo == 'FINANCEIRO':
-                    # Financeiro: valor máximo R$ 10.000
-                    if abs(tarifa) > 10000:
-                        continue
-                else:
-                    # Outros: tarifa máxima R$ 1.000
-                    if abs(tarifa) > 1000:
-                        continue
-
-                # Quantidade: máximo 100.000 kWh
-                if abs(quantidade) > 100000:
+            else:
+                # Fallback para outros tipos
+                tarifa = valores[1] if len(nums) >= 2 else 0.0
+                valor_total = valores[-1]
+                icms = 0.0
+
+            # Validação: descarta itens com valores absurdos (indicativo de parsing errado)
+            # Para ENERGIA: Tarifa não pode ser > 10 reais por kWh (proteção contra anos/datas)
+            # Para FINANCEIRO: Permite valores até R$ 10.000 (parcelamentos, multas grandes)
+            # Quantidade: não pode ser > 100000 kWh (consumo residencial típico < 2000)
+
+            if tipo in ['TE', 'TUSD', 'INJETADA', 'BANDEIRA']:
+                # Energia: tarifa máxima R$ 10/kWh
+                if abs(tarifa) > 10:
+                    continue
+            elif tipo == 'FINANCEIRO':
+                # Financeiro: valor máximo R$ 10.000
+                if abs(tarifa) > 10000:
+                    continue
+            else:
+                # Outros: tarifa máxima R$ 1.000
+                if abs(tarifa) > 1000:
                     continue
 
-                itens.append({
-                    "descricao": desc,
-                    "tipo": tipo,
-                    "quantidade": round(quantidade, 2),
-                    "tarifa_unitaria": round(tarifa, 6),
-                    "valor_total": round(valor_total, 2),
-                    "icms": round(icms, 2)
-                })
-            except:
+            # Quantidade: máximo 100.000 kWh
+            if abs(quantidade) > 100000:
                 continue
 
+            itens.append({
+                "descricao": desc,
+                "tipo": tipo,
+                "quantidade": round(quantidade, 2),
+                "tarifa_unitaria": round(tarifa, 6),
+                "valor_total": round(valor_total, 2),
+                "icms": round(icms, 2)
+            })
+
         return itens
 
+    @versao(1)
     def extract_medicoes(self, text):
         medicoes = []
 
@@ -325,6 +540,7 @@ class CopelExtractor:
 
         return medicoes
 
+    @versao(1)
     def extract_historico(self, text):
         hist = []
 
@@ -345,6 +561,7 @@ class CopelExtractor:
 
         return hist
 
+    @versao(1)
     def extract_tributos_resumo(self, text):
         tributos = {}
 
@@ -406,16 +623,16 @@ class CopelExtractor:
 
         return tributos
 
+    @versao(1)
     def extract_saldos_gd(self, text):
         """Extrai saldos de geração distribuída (SCEE)"""
         txt = self.normalize(text).upper()
 
         # Verifica se é UC geradora ou beneficiária
-        is_geradora = "MICRO/MINIGERADORA NO SCEE" in txt
-        is_beneficiaria = "BENEFICIARIA SCEE" in txt or "UC BENEFICIARIA" in txt
-
-        if not (is_geradora or is_beneficiaria):
+        tipo = self.classify_scee(txt)
+        if not tipo:
             return None
+        is_beneficiaria = tipo == "BENEFICIARIA"
 
         # Extrai UC geradora se for beneficiária
         uc_geradora = None
@@ -436,7 +653,7 @@ class CopelExtractor:
         saldo_acum_fponta = self.safe_search(r"SALDO ACUMULADO F PONTA\s*([\d\.]+)", txt)
 
         result = {
-            "tipo": "GERADORA" if is_geradora else "BENEFICIARIA",
+            "tipo": tipo,
             "uc_geradora": uc_geradora,
             "saldo_mes_kwh": self.br_money_to_float(saldo_mes) if saldo_mes else 0.0,
             "saldo_acumulado_kwh": self.br_money_to_float(saldo_acum) if saldo_acum else 0.0,
@@ -454,6 +671,7 @@ class CopelExtractor:
 
         return result
 
+    @versao(1)
     def extract_avisos_e_debitos(self, text, mes_ref, vencimento):
         """Extrai débitos anteriores e avisos"""
         bloco_deb = self.safe_search(r"(?:DEBITOS|D[ÉE]BITOS):\s*(.*?)(?:\n\n|Caso|$)", text, 1)
@@ -476,6 +694,7 @@ class CopelExtractor:
             "fatura_paga": "CONTA PAGA" in text.upper() or "ARRECADADA" in text.upper()
         }
 
+    @versao(1)
     def extract_bandeiras(self, text):
         """Extrai informações sobre bandeiras tarifárias"""
         txt = text.upper()
@@ -504,6 +723,7 @@ class CopelExtractor:
 
         return bandeiras if bandeiras else None
 
+    @versao(1)
     def extract_dados_tecnicos(self, text):
         header = text[:3000]
 
@@ -0,0 +1,45 @@
+import os
+
+from extractor import CopelExtractor
+from leitor_pdf import iterar_texto_paginas, criar_executor
+
+MAX_WORKERS_FATURAS = int(os.getenv("MAX_WORKERS_FATURAS", str(os.cpu_count() or 2)))
+
+ex = CopelExtractor()
+_pool = None
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        _pool = criar_executor(MAX_WORKERS_FATURAS)
+    return _pool
+
+
+def _extrair(texto, secoes=None, isolar=False):
+    # isolar: (dados, status por seção) do extract_secoes; senão o extract_all
+    return ex.extract_secoes(texto, secoes) if isolar else ex.extract_all(texto, secoes)
+
+
+def iterar_pdf_agrupado(fonte, paralelo=True, ocr=False, secoes=None, isolar=False):
+    """
+    Extrai todas as faturas de um PDF consolidado (várias UCs) numa única leitura.
+    As páginas são lidas em sequência e cada fatura é enviada ao pool assim que
+    sua fronteira fecha; os resultados saem na ordem em que aparecem no PDF.
+    isolar=True gera (dados, status) e uma seção com erro não derruba a fatura.
+    """
+    blocos = ex.split_invoices(iterar_texto_paginas(fonte, ocr=ocr))
+
+    if not paralelo or MAX_WORKERS_FATURAS < 2:
+        for bloco in blocos:
+            yield _extrair(bloco, secoes, isolar)
+        return
+
+    futuros = [_get_pool().submit(_extrair, bloco, secoes, isolar) for bloco in blocos]
+    for f in futuros:
+        yield f.result()
+
+
+def processar_pdf_agrupado(fonte, paralelo=True, ocr=False, secoes=None, isolar=False):
+    """Lista com o extract_all de cada fatura do PDF consolidado"""
+    return list(iterar_pdf_agrupado(fonte, paralelo, ocr, secoes, isolar))
@@ -0,0 +1,562 @@
+import os
+import gzip
+import json
+import time
+import random
+import argparse
+from collections import Counter
+from datetime import date, timedelta
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from extractor import CopelExtractor
+
+# Faturas sintéticas no layout Copel (texto como o pdfplumber devolve, ou PDF),
+# com o gabarito (resultado esperado por seção) conhecido de antemão.
+# Cada fatura i é gerada da semente + i: o mesmo comando reproduz o mesmo acervo.
+PASTA_SAIDA = "sinteticos"
+VARIANTES = ["residencial", "rural", "usina"]
+TAMANHO_BLOCO = 5000
+
+MESES_ABREV = ["JAN", "FEV", "MAR", "ABR", "MAI", "JUN", "JUL", "AGO", "SET", "OUT", "NOV", "DEZ"]
+MESES_HISTORICO = 13
+
+# Tolerância na comparação de números com o gabarito (arredondamento a 2 casas)
+TOLERANCIA_NUMERO = 0.006
+
+NOMES = ["ANA", "BRUNO", "CARLOS", "DANIELA", "EDUARDO", "FERNANDA", "GABRIEL", "HELENA", "IVO",
+         "JULIANA", "LUCAS", "MARIA", "NELSON", "OLGA", "PAULO", "RAFAELA", "SERGIO", "TEREZA"]
+SOBRENOMES = ["SILVA", "SANTOS", "OLIVEIRA", "SOUZA", "KOWALSKI", "BARKEMA", "RIBAS", "MULLER",
+              "PEREIRA", "COSTA", "ALMEIDA", "SCHMIDT", "LIMA", "ROCHA", "NOVAK", "CARVALHO"]
+LOGRADOUROS = ["Rua das Araucarias", "Av Brasil", "Rua XV de Novembro", "Rod PR 340 - Km 55",
+               "Rua Marechal Deodoro", "Estrada Rural Linha Bonita", "Av Parana", "Rua Sete de Setembro"]
+CIDADES = [("Curitiba", "80"), ("Londrina", "86"), ("Maringa", "87"), ("Cascavel", "85"),
+           ("Ponta Grossa", "84"), ("Tibagi", "84"), ("Sao Jorge Doeste", "85"), ("Guarapuava", "85")]
+ATIVIDADES_RURAIS = ["Cultivo de Milho", "Cultivo de Soja", "Criacao de Bovinos P Leite", "Cultivo de Trigo"]
+FASES = ["Monofasico", "Bifasico", "Trifasico"]
+
+
+# ============================================================================
+# Formatação no padrão da fatura
+# ============================================================================
+
+def br(valor, casas=2, milhar=True):
+    """1234.5 -> "1.234,50" """
+    texto = f"{abs(valor):,.{casas}f}" if milhar else f"{abs(valor):.{casas}f}"
+    texto = texto.replace(",", "_").replace(".", ",").replace("_", ".")
+    return ("-" if valor < 0 else "") + texto
+
+
+def mes_anterior(mes, ano, n=1):
+    indice = ano * 12 + mes - 1 - n
+    return indice % 12 + 1, indice // 12
+
+
+def data(dia, mes, ano):
+    return f"{dia:02d}/{mes:02d}/{ano}"
+
+
+# ============================================================================
+# Geração de uma fatura
+# ============================================================================
+
+class _Fatura:
+    """Acumula as linhas das páginas e o gabarito de uma fatura sintética"""
+
+    def __init__(self, identificador):
+        self.id = identificador
+        self.itens = []
+        self.linhas_itens = []
+
+    def item(self, descricao, tipo, unidade, quantidade, tarifa, aliquota, casas_qtd=0):
+        valor = round(quantidade * tarifa, 2)
+        icms = round(valor * aliquota / 100, 2)
+        tarifa_sem = round(tarifa * (1 - aliquota / 100), 6)
+        self.linhas_itens.append(
+            f"{descricao} {unidade} {br(quantidade, casas_qtd)} {br(tarifa, 6)} {br(valor)} {br(icms)} "
+            f"0,00 {br(tarifa_sem, 6)}")
+        self.itens.append({"tipo": tipo, "quantidade": round(quantidade, 2), "tarifa_unitaria": tarifa,
+                           "valor_total": valor, "icms": icms})
+        return valor
+
+    def item_unitario(self, descricao, tipo, valor):
+        """Cobrança sem quantidade (iluminação, multa, juros, parcela): "UN 1 <valor>" """
+        self.linhas_itens.append(f"{descricao} UN 1 {br(valor)}")
+        self.itens.append({"tipo": tipo, "quantidade": 1, "tarifa_unitaria": valor,
+                           "valor_total": valor, "icms": 0.0})
+        return valor
+
+
+def gerar_fatura(indice, variante=None, semente=0):
+    """(páginas de texto, gabarito) da fatura sintética `indice`"""
+    rng = random.Random(semente * 1_000_003 + indice)
+    variante = variante or rng.choice(VARIANTES)
+    f = _Fatura(f"SINT{indice:09d}")
+
+    # "usina": UC de baixa tensão com medidor de geração (GERAC), geradora no SCEE
+    usina = variante == "usina"
+    rural = variante == "rural" or (usina and rng.random() < 0.5)
+
+    # ---------------- Cliente / técnico ----------------
+    mes, ano = rng.randint(1, 12), rng.choice([2023, 2024, 2025])
+    nome = f"{rng.choice(NOMES)} {rng.choice(SOBRENOMES)} {rng.choice(SOBRENOMES)}"
+    uc = str(rng.randint(1_000_000, 99_999_999))
+    cidade, prefixo_cep = rng.choice(CIDADES)
+    cep = f"{prefixo_cep}{rng.randint(0, 999):03d}-{rng.randint(0, 999):03d}"
+    logradouro = f"{rng.choice(LOGRADOUROS)}, {rng.randint(1, 3999)}" + (" - Rural" if rural else "")
+    documento = f"***.***.*{rng.randint(10, 99)}-{rng.randint(10, 99)}"
+
+    fase = "Trifasico" if usina else rng.choice(FASES)
+    baixa_renda = variante == "residencial" and rng.random() < 0.1
+    if rural:
+        classificacao = f"B2 Rural / {rng.choice(ATIVIDADES_RURAIS)}"
+    else:
+        classificacao = "B1 Residencial / Residencial" + (" Baixa Renda" if baixa_renda else "")
+    tensao = rng.choice(["127/220", "220/380"])
+    disjuntor = f"{rng.choice([40, 50, 63, 70, 100])}A"
+
+    # ---------------- Datas ----------------
+    m_ant, a_ant = mes_anterior(mes, ano)
+    dias = rng.randint(28, 33)
+    d_atual = date(ano, mes, rng.randint(1, 28))
+    leitura_atual = d_atual.strftime("%d/%m/%Y")
+    leitura_anterior = (d_atual - timedelta(days=dias)).strftime("%d/%m/%Y")
+    proxima = (d_atual + timedelta(days=rng.randint(28, 33))).strftime("%d/%m/%Y")
+    emissao = data(rng.randint(1, 5), mes, ano)
+    vencimento = data(rng.randint(10, 28), mes, ano)
+    mes_referencia = f"{mes:02d}/{ano}"
+
+    # ---------------- Bandeiras ----------------
+    cores = rng.choice([["Verde"], ["Amarela"], ["Verde", "Amarela"], ["Vermelha P1"], ["Amarela", "Vermelha P2"]])
+    corte = rng.randint(5, 25)
+    periodos = []
+    for j, cor in enumerate(cores):
+        inicio = f"{1 if j == 0 else corte + 1:02d}/{m_ant:02d}"
+        fim = f"{corte if j < len(cores) - 1 else 30:02d}/{m_ant:02d}"
+        nome_cor, _, patamar = cor.partition(" P")
+        periodos.append({"tipo": nome_cor, "periodo": patamar or None, "data_inicio": inicio, "data_fim": fim})
+
+    # ---------------- Itens de energia ----------------
+    aliquota = 0.0 if baixa_renda else 19.0
+    valores = []
+    # Acima de 999 kWh a quantidade sai com separador de milhar ("1.250")
+    consumo = rng.randint(80, 900) if not usina else rng.randint(300, 2500)
+    tarifa_te = round(rng.uniform(0.28, 0.42), 6)
+    tarifa_tusd = round(rng.uniform(0.33, 0.5), 6)
+
+    valores.append(f.item("ENERGIA ELET CONSUMO" + (" S" if rng.random() < 0.7 else ""), "TE", "kWh",
+                          consumo, tarifa_te, aliquota))
+    valores.append(f.item("ENERGIA ELET USO SISTEMA", "TUSD", "kWh", consumo, tarifa_tusd, aliquota))
+
+    # Bandeiras não verdes geram adicional proporcional aos dias
+    tarifas_bandeira = {}
+    for p in periodos:
+        if p["tipo"] == "Verde":
+            continue
+        qtd = round(consumo * rng.uniform(0.2, 0.9), 2)
+        tarifas_bandeira[p["tipo"]] = round(rng.uniform(0.018, 0.09), 6)
+        valores.append(f.item(f"ENERGIA CONS. B.{p['tipo'].upper()}", "BANDEIRA", "kWh", qtd,
+                              tarifas_bandeira[p["tipo"]], aliquota, casas_qtd=2))
+
+    medidor = f"{rng.randint(10_000_000, 99_999_999):010d}"
+    leitura = rng.randint(1000, 90_000)
+    medicoes_linhas = [f"{medidor} CONSUMO kWh {leitura} {leitura + consumo} 1 {consumo}"]
+    medicoes = [{"numero_medidor": medidor, "tipo": "CONSUMO", "leitura_anterior": leitura,
+                 "leitura_atual": leitura + consumo, "consumo_kwh": consumo}]
+
+    # ---------------- SCEE ----------------
+    scee = None
+    scee_linhas = []
+    papel = "GERADORA" if usina else rng.choices([None, "GERADORA", "BENEFICIARIA"], [0.6, 0.2, 0.2])[0]
+
+    if papel:
+        # Créditos compensados: do mês (injetada) e, na usina, de meses anteriores de outra UC (OUC)
+        meses_credito = [(m_ant, a_ant)]
+        if usina:
+            meses_credito += [mes_anterior(m_ant, a_ant, n) for n in range(1, rng.randint(1, 3) + 1)]
+        restante = consumo
+        for n, (m_c, a_c) in enumerate(meses_credito):
+            injetado = rng.randint(1, max(1, restante // 2)) if n < len(meses_credito) - 1 else max(1, restante // 2)
+            restante -= injetado
+            rotulo = "INJETADA" if n == 0 else "INJ. OUC MPT"
+            sufixo = " GDI" if usina and rng.random() < 0.5 else ""
+            valores.append(f.item(f"ENERGIA {rotulo} TE {m_c:02d}/{a_c}{sufixo}", "TE", "kWh",
+                                  -injetado, tarifa_te, aliquota))
+            valores.append(f.item(f"ENERGIA {rotulo} TUSD {m_c:02d}/{a_c}{sufixo}", "TUSD", "kWh",
+                                  -injetado, tarifa_tusd, aliquota))
+
+        # Crédito também abate o adicional de bandeira. Como nas faturas reais
+        # (resultado_todos_pdfs.txt): "... TE" é INJETADA; com patamar ("... TE P1") vira TE
+        for cor, tarifa in tarifas_bandeira.items():
+            patamar = next((f" P{p['periodo']}" for p in periodos if p["tipo"] == cor and p["periodo"]), "")
+            valores.append(f.item(f"ENERGIA INJ. BAND. {cor.upper()} TE{patamar}", "TE" if patamar else "INJETADA", "kWh",
+                                  -round(consumo * rng.uniform(0.05, 0.3), 2), tarifa, aliquota, casas_qtd=2))
+
+        uc_geradora = str(rng.randint(1_000_000, 99_999_999)) if papel == "BENEFICIARIA" else None
+        if papel == "GERADORA":
+            scee_linhas.append("Unidade Micro/Minigeradora no SCEE. ATENÇÃO: O aumento de potência de geração "
+                               "à revelia enseja em suspensão imediata do fornecimento.")
+        else:
+            scee_linhas.append(f"UC Beneficiaria SCEE - Geradora: UC {uc_geradora}")
+
+        saldo_mes, saldo_acum, expirar = rng.randint(0, 900), rng.randint(0, 20000), rng.randint(0, 300)
+        scee = {"tipo": papel, "uc_geradora": uc_geradora, "saldo_mes_kwh": float(saldo_mes),
+                "saldo_acumulado_kwh": float(saldo_acum), "saldo_expirar_kwh": float(expirar)}
+
+        if usina and rng.random() < 0.5:
+            # Layout mais recente: saldos discriminados por posto (em baixa tensão, ponta zerada)
+            scee_linhas.append(f"Saldo Mês Ponta 0 Saldo Mês F Ponta {br(saldo_mes, 0)}")
+            scee_linhas.append(f"Saldo Acumulado Ponta 0 Saldo Acumulado F Ponta {br(saldo_acum, 0)}")
+            scee_linhas.append(f"Saldo a Expirar Próximo Mês: {br(expirar, 0)} kWh.")
+            scee["saldo_mes_kwh"] = scee["saldo_acumulado_kwh"] = 0.0
+            scee["detalhamento_periodos"] = {"saldo_mes_ponta": 0.0, "saldo_mes_fora_ponta": float(saldo_mes),
+                                             "saldo_acum_ponta": 0.0, "saldo_acum_fora_ponta": float(saldo_acum)}
+        else:
+            scee_linhas.append(f"Saldo Mês: {br(saldo_mes, 0)} kWh, Saldo Acumulado: {br(saldo_acum, 0)} kWh, "
+                               f"Saldo a Expirar Próximo Mês: {br(expirar, 0)} kWh.")
+
+    if usina:
+        gerado = rng.randint(500, 6000)
+        leitura = rng.randint(1000, 90_000)
+        medicoes_linhas.append(f"{medidor} GERAC kWh {leitura} {leitura + gerado} 1 {gerado}")
+        medicoes.append({"numero_medidor": medidor, "tipo": "GERACAO", "leitura_anterior": leitura,
+                         "leitura_atual": leitura + gerado, "consumo_kwh": gerado})
+
+    # ---------------- Tributos (base = itens de energia) ----------------
+    base_icms = round(sum(valores), 2)
+    icms = round(base_icms * aliquota / 100, 2)
+    pis, cofins = round(base_icms * 0.0111, 2), round(base_icms * 0.0513, 2)
+
+    # ---------------- Iluminação, débitos e financeiros ----------------
+    valores.append(f.item_unitario("CONT ILUMIN PUBLICA MUNICIPIO", "IP", round(rng.uniform(10, 90), 2)))
+
+    debitos = []
+    if rng.random() < 0.15:
+        for n in range(1, rng.randint(1, 3) + 1):
+            m_deb, a_deb = mes_anterior(mes, ano, n)
+            debitos.append({"mes_ano": f"{m_deb:02d}/{a_deb}", "valor": round(rng.uniform(50, 800), 2)})
+        valores.append(f.item_unitario("MULTA POR ATRASO NO PAGAMENTO", "FINANCEIRO", round(rng.uniform(1, 20), 2)))
+        valores.append(f.item_unitario("JUROS CONTA ANTERIOR", "FINANCEIRO", round(rng.uniform(0.5, 8), 2)))
+        valores.append(f.item_unitario("ACRESCIMO MORATORIO", "FINANCEIRO", round(rng.uniform(0.5, 8), 2)))
+
+    if rng.random() < 0.1:
+        parcela, parcelas = rng.randint(1, 12), 12
+        valores.append(f.item_unitario(f"PARCELAMENTO DE DEBITO {parcela:03d}/{parcelas:03d}", "FINANCEIRO",
+                                       round(rng.uniform(20, 300), 2)))
+
+    valor_total = round(sum(valores), 2)
+    paga = not debitos and rng.random() < 0.3
+
+    # ---------------- Identificação fiscal ----------------
+    nf = rng.randint(100_000_000, 999_999_999)
+    chave = f"41{ano % 100:02d}{mes:02d}04368898000106660031{nf}{rng.randint(0, 10 ** 13 - 1):013d}"[:44]
+    numero_fatura = f"FAT-01-{ano}{rng.randint(10 ** 12, 10 ** 13 - 1)}-{rng.randint(1, 99)}"
+    hash_fisco = ".".join("".join(rng.choice("0123456789ABCDEF") for _ in range(4)) for _ in range(8))
+
+    # ---------------- Histórico ----------------
+    historico = []
+    for n in range(MESES_HISTORICO):
+        m_h, a_h = mes_anterior(mes, ano, n)
+        kwh = consumo if n == 0 else max(0, int(consumo * rng.uniform(0.6, 1.4)))
+        historico.append({"mes_ano": f"{MESES_ABREV[m_h - 1]}{a_h % 100:02d}", "consumo_kwh": kwh,
+                          "dias_faturados": dias if n == 0 else rng.randint(28, 33)})
+
+    # ---------------- Texto ----------------
+    pagina1 = [
+        "DANF3E - DOCUMENTO AUXILIAR DA",
+        "NOTA FISCAL ELETRÔNICA DE ENERGIA ELÉTRICA",
+        "Copel Distribuição S.A.",
+        "R Jose Izidoro Biazetto, 158 - Bloco C - Mossungue",
+        "CEP: 81200-240 - Curitiba - PR",
+        "CNPJ 04.368.898/0001-06",
+        "INSC. ESTADUAL 9023307399",
+        f"Responsável pela Iluminação Pública: Municipio {rng.randint(10 ** 9, 10 ** 10 - 1)}",
+        f"Classificação: {classificacao}",
+        f"Tipo de Fornecimento: {fase} / {disjuntor}",
+        "Modalidade Tarifária: CONVENCIONAL Grupo de Tensão: B - Baixa Tensao",
+        f"Tensão Nominal: {tensao} V",
+        f"Nome: {nome}",
+        f"{leitura_anterior} {leitura_atual} {dias} {proxima}",
+        f"Endereço: {logradouro}",
+        f"CEP: {cep}",
+        f"Cidade: {cidade} - Estado: PR",
+        f"CPF: {documento}",
+        "UNIDADE CONSUMIDORA",
+        uc,
+        f"NOTA FISCAL No. {nf} - SÉRIE 3",
+        f"DATA DE EMISSÃO: {emissao}",
+        "Chave de Acesso",
+        " ".join(chave[i:i + 4] for i in range(0, 44, 4)),
+        f"Protocolo de Autorização: {rng.randint(10 ** 15, 10 ** 16 - 1)}",
+        f"{mes_referencia} {vencimento} R${br(valor_total)}",
+        "Itens da Fatura Unid. Quant. Preço unit (R$) com tributos Valor (R$) ICMS",
+        *f.linhas_itens,
+        f"TOTAL {br(valor_total)} {br(icms)}",
+        *medicoes_linhas,
+        hash_fisco,
+        "Página: 1 / 2"
+    ]
+    if rng.random() < 0.3:
+        pagina1.insert(4, "Segunda Via")
+
+    pagina2 = [
+        "HISTÓRICO DE CONSUMO",
+        "MÊS/ANO CONSUMO FATURADO Nº DIAS FAT.",
+        *(f"{h['mes_ano']} {br(h['consumo_kwh'], 0)} {h['dias_faturados']}" for h in historico),
+        "Reservado ao Fisco",
+        f"ICMS {br(base_icms)} {br(aliquota)}% {br(icms)}",
+        f"INCLUSO NA FATURA PIS R${br(pis)} E COFINS R${br(cofins)}",
+        *scee_linhas
+    ]
+    if debitos:
+        pagina2.append("DÉBITOS: " + " ".join(f"{d['mes_ano']} R$ {br(d['valor'])}" for d in debitos) +
+                       " Caso já tenha efetuado o pagamento, desconsidere este aviso.")
+        pagina2.append("REAVISO DE VENCIMENTO - FATURA SUJEITA AO CORTE DO FORNECIMENTO")
+    if paga:
+        pagina2.append(f"FATURA DO MES {mes_referencia} ARRECADADA POR DEBITO AUTOMATICO")
+    pagina2 += [
+        "Periodos Band.Tarif.: " + " ".join(
+            f"{p['tipo']}{' P' + p['periodo'] if p['periodo'] else ''}:{p['data_inicio']}-{p['data_fim']}"
+            for p in periodos),
+        f"{uc} {mes_referencia} {vencimento} R${br(valor_total)}",
+        f"Nùmero da fatura: {numero_fatura}",
+        "Página: 2 / 2"
+    ]
+
+    gabarito = {
+        "cliente": {"nome": nome, "uc": uc, "cpf_cnpj": documento,
+                    "endereco": {"logradouro": logradouro, "cidade": cidade, "estado": "PR", "cep": cep}},
+        "fatura": {"mes_referencia": mes_referencia, "vencimento": vencimento, "valor_total": valor_total,
+                   "data_emissao": emissao, "proxima_leitura": proxima, "chave_acesso": chave,
+                   "numero_fatura": numero_fatura, "hash_fisco": hash_fisco},
+        "itens": f.itens,
+        "medicoes": medicoes,
+        "historico": historico,
+        "tributos": {"icms": {"base_calculo": base_icms, "aliquota_percentual": aliquota, "valor": icms},
+                     "pis": {"valor": pis}, "cofins": {"valor": cofins}},
+        "solar_scee": scee,
+        "avisos_debitos": {"debitos_anteriores": debitos, "aviso_corte": bool(debitos), "fatura_paga": paga},
+        "tecnico": {"classificacao": classificacao, "tipo_fase": fase, "tensao_nominal": tensao,
+                    "disjuntor": disjuntor, "modalidade_tarifaria": "CONVENCIONAL", "grupo_tarifario": "B",
+                    "tarifa_social": baixa_renda},
+        "bandeiras": periodos
+    }
+
+    return [("\n".join(pagina1)), "\n".join(pagina2)], {"id": f.id, "variante": variante, "gabarito": gabarito}
+
+
+# ============================================================================
+# PDF mínimo (Helvetica, WinAnsi), sem dependências
+# ============================================================================
+
+LINHAS_POR_PAGINA = 80
+
+
+def _escapar_pdf(linha):
+    linha = linha.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    return linha.encode("cp1252", errors="replace")
+
+
+def texto_para_pdf(paginas):
+    """PDF com uma linha de texto por linha da página (o pdfplumber devolve as mesmas linhas)"""
+    folhas = []
+    for pagina in paginas:
+        linhas = pagina.split("\n")
+        folhas += [linhas[i:i + LINHAS_POR_PAGINA] for i in range(0, len(linhas), LINHAS_POR_PAGINA)] or [[]]
+
+    objetos = [None, None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"]
+    kids = []
+    for linhas in folhas:
+        conteudo = b"BT /F1 7 Tf 9 TL 28 814 Td " + b"".join(b"(" + _escapar_pdf(l) + b") Tj T* " for l in linhas) + b"ET"
+        objetos.append(b"<< /Length %d >>\nstream\n" % len(conteudo) + conteudo + b"\nendstream")
+        conteudo_id = len(objetos)
+        objetos.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % conteudo_id)
+        kids.append(b"%d 0 R" % len(objetos))
+
+    objetos[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objetos[1] = b"<< /Type /Pages /Kids [" + b" ".join(kids) + b"] /Count %d >>" % len(kids)
+
+    saida = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for numero, corpo in enumerate(objetos, 1):
+        offsets.append(len(saida))
+        saida += b"%d 0 obj\n" % numero + corpo + b"\nendobj\n"
+
+    xref = len(saida)
+    saida += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objetos) + 1)
+    saida += b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    saida += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objetos) + 1, xref)
+    return bytes(saida)
+
+
+# ============================================================================
+# Geração em paralelo (cada worker grava o próprio bloco direto no disco)
+# ============================================================================
+
+def _abrir_bloco(caminho, modo):
+    # gzip nível 1: o texto das faturas comprime ~4x sem pesar na geração
+    if caminho.endswith(".gz"):
+        return gzip.open(caminho, modo + "t", encoding="utf-8", compresslevel=1)
+    return open(caminho, modo, encoding="utf-8")
+
+
+def _gerar_bloco(inicio, fim, pasta, formato, variantes, semente, comprimir=False):
+    """Gera as faturas [inicio, fim) num arquivo JSONL (e PDFs, no formato pdf); devolve a quantidade"""
+    nome_bloco = f"bloco_{inicio:010d}"
+    pasta_pdfs = os.path.join(pasta, nome_bloco)
+    if formato == "pdf":
+        os.makedirs(pasta_pdfs, exist_ok=True)
+
+    rng = random.Random(semente * 7919 + inicio)
+    arquivo_bloco = os.path.join(pasta, nome_bloco + (".jsonl.gz" if comprimir else ".jsonl"))
+    temporario = os.path.join(pasta, nome_bloco + (".tmp.gz" if comprimir else ".tmp"))
+
+    with _abrir_bloco(temporario, "w") as saida:
+        for indice in range(inicio, fim):
+            paginas, registro = gerar_fatura(indice, rng.choice(variantes), semente)
+
+            if formato == "pdf":
+                caminho = os.path.join(nome_bloco, f"{registro['id']}.pdf")
+                with open(os.path.join(pasta, caminho), "wb") as f:
+                    f.write(texto_para_pdf(paginas))
+                registro["pdf"] = caminho
+            else:
+                registro["texto"] = "\n".join(paginas)
+
+            saida.write(json.dumps(registro, ensure_ascii=False) + "\n")
+
+    # Bloco só aparece completo: um gerar interrompido não deixa JSONL pela metade
+    os.replace(temporario, arquivo_bloco)
+    return fim - inicio
+
+
+def gerar(quantidade, pasta=PASTA_SAIDA, formato="texto", variantes=VARIANTES, semente=0,
+          workers=None, tamanho_bloco=TAMANHO_BLOCO, inicio=0, comprimir=False):
+    os.makedirs(pasta, exist_ok=True)
+    blocos = [(i, min(i + tamanho_bloco, inicio + quantidade)) for i in range(inicio, inicio + quantidade, tamanho_bloco)]
+
+    gerados = 0
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futuros = [pool.submit(_gerar_bloco, a, b, pasta, formato, variantes, semente, comprimir) for a, b in blocos]
+        for futuro in as_completed(futuros):
+            gerados += futuro.result()
+            decorrido = time.perf_counter() - t0
+            print(f"\r{gerados}/{quantidade} faturas ({gerados / decorrido:,.0f}/s)", end="", flush=True)
+    print()
+    return gerados
+
+
+# ============================================================================
+# Conferência: extract_all contra o gabarito
+# ============================================================================
+
+def _igual(obtido, esperado):
+    if isinstance(esperado, float) or isinstance(obtido, float):
+        try:
+            return abs(float(obtido) - float(esperado)) <= TOLERANCIA_NUMERO
+        except (TypeError, ValueError):
+            return False
+    return obtido == esperado
+
+
+def comparar(dados, gabarito, caminho=""):
+    """Lista de campos divergentes ("itens[].valor_total", "cliente.uc"...)"""
+    if isinstance(gabarito, dict):
+        if not isinstance(dados, dict):
+            return [caminho or "raiz"]
+        divergencias = []
+        for chave, esperado in gabarito.items():
+            divergencias += comparar(dados.get(chave), esperado, f"{caminho}.{chave}" if caminho else chave)
+        return divergencias
+
+    if isinstance(gabarito, list):
+        if not isinstance(dados, list) or len(dados) != len(gabarito):
+            return [f"{caminho}.quantidade"]
+        return [d for obtido, esperado in zip(dados, gabarito) for d in comparar(obtido, esperado, f"{caminho}[]")]
+
+    return [] if _igual(dados, gabarito) else [caminho]
+
+
+def _conferir_bloco(caminho_bloco):
+    """(faturas, faturas corretas, Counter de campos divergentes, segundos no extract_all)"""
+    from leitor_pdf import extrair_texto_pdf
+
+    ex = CopelExtractor()
+    pasta = os.path.dirname(caminho_bloco)
+    total, corretas, divergencias, tempo = 0, 0, Counter(), 0.0
+
+    with _abrir_bloco(caminho_bloco, "r") as f:
+        for linha in f:
+            registro = json.loads(linha)
+            texto = registro.get("texto")
+            if texto is None:
+                texto = extrair_texto_pdf(os.path.join(pasta, registro["pdf"]))
+
+            t0 = time.perf_counter()
+            dados = ex.extract_all(texto)
+            tempo += time.perf_counter() - t0
+
+            erradas = set(comparar(dados, registro["gabarito"]))
+            divergencias.update(erradas)
+            total += 1
+            corretas += not erradas
+
+    return total, corretas, divergencias, tempo
+
+
+def conferir(pasta=PASTA_SAIDA, workers=None):
+    blocos = sorted(os.path.join(pasta, a) for a in os.listdir(pasta) if a.endswith((".jsonl", ".jsonl.gz")))
+
+    total, corretas, divergencias, tempo_cpu = 0, 0, Counter(), 0.0
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for t, c, d, s in pool.map(_conferir_bloco, blocos):
+            total, corretas, tempo_cpu = total + t, corretas + c, tempo_cpu + s
+            divergencias.update(d)
+    decorrido = time.perf_counter() - t0
+
+    print(f"Faturas: {total} | Corretas: {corretas} ({corretas / max(total, 1):.1%}) | "
+          f"{total / decorrido:,.0f} faturas/s ({decorrido:.1f}s)")
+    print(f"extract_all: {tempo_cpu / max(total, 1) * 1000:.2f} ms/fatura por processo")
+    for campo, n in divergencias.most_common():
+        print(f"  {campo}: {n} ({n / total:.1%})")
+
+    return total, corretas, divergencias
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Faturas Copel sintéticas com gabarito (geração e conferência)")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_gerar = sub.add_parser("gerar", help="Gera faturas em blocos JSONL (texto ou PDF) com o gabarito")
+    p_gerar.add_argument("quantidade", type=int)
+    p_gerar.add_argument("--saida", default=PASTA_SAIDA)
+    p_gerar.add_argument("--formato", choices=["texto", "pdf"], default="texto",
+                         help="texto: só o texto no JSONL (milhões/min); pdf: um PDF por fatura")
+    p_gerar.add_argument("--variantes", default=",".join(VARIANTES), help=f"Subconjunto de {', '.join(VARIANTES)}")
+    p_gerar.add_argument("--semente", type=int, default=0)
+    p_gerar.add_argument("--inicio", type=int, default=0, help="Índice da primeira fatura (para ampliar um acervo)")
+    p_gerar.add_argument("--bloco", type=int, default=TAMANHO_BLOCO, help="Faturas por arquivo/tarefa")
+    p_gerar.add_argument("--workers", type=int, default=None)
+    p_gerar.add_argument("--comprimir", action="store_true", help="Blocos em .jsonl.gz")
+
+    p_conferir = sub.add_parser("conferir", help="Roda o extract_all nas faturas geradas e compara com o gabarito")
+    p_conferir.add_argument("pasta", nargs="?", default=PASTA_SAIDA)
+    p_conferir.add_argument("--workers", type=int, default=None)
+
+    args = parser.parse_args()
+
+    if args.comando == "gerar":
+        variantes = args.variantes.split(",")
+        desconhecidas = set(variantes) - set(VARIANTES)
+        if desconhecidas:
+            parser.error(f"Variantes desconhecidas: {', '.join(sorted(desconhecidas))}")
+        gerar(args.quantidade, args.saida, args.formato, variantes, args.semente, args.workers, args.bloco, args.inicio,
+              args.comprimir)
+    else:
+        conferir(args.pasta, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+import os
+import sys
+import json
+import time
+import select
+import signal
+import sqlite3
+import struct
+import argparse
+import ctypes
+import ctypes.util
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from extractor import CopelExtractor
+from leitor_pdf import extrair_texto_pdf
+from armazem_faturas import ArmazemFaturas
+from cache_paginas import hash_fonte
+from creditos_scee import LivroCreditosSCEE
+
+# Configurações padrão (sobrescrevíveis pela linha de comando)
+PASTA_ENTRADA = "entrada"
+PASTA_SAIDA = "processados"
+PASTA_FALHAS = "falhas"
+ARQUIVO_ESTADO = "ingestao_estado.db"
+INTERVALO_POLLING = 2.0
+
+# Tempo máximo de extração de um arquivo no worker (PDF malformado que trava o parser)
+TIMEOUT_ARQUIVO = float(os.getenv("TIMEOUT_ARQUIVO_INGESTAO", "120"))
+
+# Arquivo modificado há menos que isso pode ainda estar sendo copiado (polling)
+ESTABILIDADE_SEGUNDOS = 2.0
+
+# inotify (linux/inotify.h)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+_EVENTO = struct.Struct("iIII")
+
+ex = CopelExtractor()
+_armazem = None
+_livro_creditos = None
+
+
+# ============================================================================
+# Worker
+# ============================================================================
+
+def _get_armazem():
+    global _armazem
+    if _armazem is None:
+        _armazem = ArmazemFaturas()
+    return _armazem
+
+
+def _get_livro_creditos():
+    global _livro_creditos
+    if _livro_creditos is None:
+        _livro_creditos = LivroCreditosSCEE()
+    return _livro_creditos
+
+
+def _inicializar_worker():
+    # Os handlers do daemon (parar o laço) são herdados no fork e não valem aqui:
+    # Ctrl+C no terminal fica com o processo principal, que encerra o pool;
+    # SIGTERM volta a encerrar o worker
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+class TempoEsgotado(Exception):
+    pass
+
+
+def processar_arquivo(caminho, pasta_saida, pasta_falhas, timeout=TIMEOUT_ARQUIVO):
+    """
+    Extrai um PDF e grava o JSON em pasta_saida (ou o erro em pasta_falhas).
+    O texto bruto vai para o armazém, para reprocessamento sem reler o PDF, e os
+    saldos de GD para o livro de créditos SCEE.
+
+    O arquivo é lido uma vez: hash e extração usam os mesmos bytes. Devolve
+    (stat, hash) do conteúdo efetivamente processado e o erro (ou None).
+    """
+    nome = os.path.splitext(os.path.basename(caminho))[0] + ".json"
+    st, conteudo_hash = None, None
+
+    # SIGALRM interrompe a extração no worker (não existe no Windows: lá fica sem limite)
+    alarme = timeout and hasattr(signal, "SIGALRM")
+    if alarme:
+        def estourar(*_):
+            raise TempoEsgotado(f"Extração passou de {timeout:g}s")
+
+        signal.signal(signal.SIGALRM, estourar)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+
+    try:
+        with open(caminho, "rb") as f:
+            conteudo = f.read()
+            st = os.fstat(f.fileno())
+        conteudo_hash = hash_fonte(conteudo)
+
+        # Sem o pool de páginas do leitor_pdf: o paralelismo aqui já é entre arquivos
+        # (um pool por worker daria até workers x núcleos processos)
+        raw_text = extrair_texto_pdf(conteudo, paralelo=False)
+        if not raw_text.strip():
+            raise ValueError("Não foi possível extrair texto do PDF (pode ser uma imagem).")
+
+        dados = ex.extract_all(raw_text)
+        if alarme:
+            # Daqui em diante só gravação: não pode ser interrompida pela metade
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        _get_armazem().guardar(conteudo_hash, os.path.basename(caminho), raw_text, dados)
+        _get_livro_creditos().registrar(dados)
+
+        registro = {"arquivo": os.path.basename(caminho), "status": "OK", "dados": dados}
+        destino, erro = os.path.join(pasta_saida, nome), None
+
+    except Exception as e:
+        registro = {"arquivo": os.path.basename(caminho), "status": "ERRO", "erro": str(e)}
+        destino, erro = os.path.join(pasta_falhas, nome), str(e)
+
+    finally:
+        if alarme:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+    _gravar_registro(destino, registro)
+    return st, conteudo_hash, erro
+
+
+def _gravar_registro(destino, registro):
+    # Grava em arquivo temporário e renomeia: quem lê a pasta nunca vê JSON pela metade
+    temporario = destino + ".tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(registro, f, ensure_ascii=False, indent=2)
+    os.replace(temporario, destino)
+
+
+# ============================================================================
+# Estado (SQLite local)
+# ============================================================================
+
+class EstadoIngestao:
+    """Arquivos já vistos: mtime/tamanho para o atalho barato, hash do conteúdo para decidir"""
+
+    def __init__(self, caminho):
+        self.conn = sqlite3.connect(caminho)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS arquivos (
+                caminho TEXT PRIMARY KEY,
+                mtime REAL,
+                tamanho INTEGER,
+                hash TEXT,
+                status TEXT,
+                erro TEXT,
+                processado_em REAL
+            )
+        """)
+        self.conn.commit()
+
+    def precisa_processar(self, caminho, st):
+        """(precisa?, hash). Só calcula o hash quando mtime/tamanho mudaram"""
+        linha = self.conn.execute(
+            "SELECT mtime, tamanho, hash FROM arquivos WHERE caminho = ?", (caminho,)).fetchone()
+
+        if linha and linha[0] == st.st_mtime and linha[1] == st.st_size:
+            return False, linha[2]
+
+        conteudo_hash = hash_fonte(caminho)
+
+        if linha and linha[2] == conteudo_hash:
+            # Só o mtime mudou (touch, cópia repetida): atualiza e não reprocessa
+            self.conn.execute("UPDATE arquivos SET mtime = ?, tamanho = ? WHERE caminho = ?",
+                              (st.st_mtime, st.st_size, caminho))
+            self.conn.commit()
+            return False, conteudo_hash
+
+        return True, conteudo_hash
+
+    def registrar(self, caminho, st, conteudo_hash, erro):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO arquivos VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (caminho, st.st_mtime, st.st_size, conteudo_hash, "ERRO" if erro else "OK", erro, time.time()))
+        self.conn.commit()
+
+
+# ============================================================================
+# Observação da pasta: inotify (Linux) ou polling
+# ============================================================================
+
+class ObservadorInotify:
+    """Eventos de arquivo fechado após escrita / movido para a pasta (sem rescans)"""
+
+    def __init__(self, pasta):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.pasta = pasta
+        self.fd = libc.inotify_init1(os.O_NONBLOCK)
+        if self.fd < 0 or libc.inotify_add_watch(self.fd, os.fsencode(pasta), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            raise OSError(ctypes.get_errno(), "inotify indisponível")
+
+    def aguardar(self, timeout):
+        """Caminhos de PDFs prontos que chegaram dentro do timeout"""
+        prontos, _, _ = select.select([self.fd], [], [], timeout)
+        if not prontos:
+            return []
+
+        dados = os.read(self.fd, 64 * 1024)
+        caminhos = []
+        offset = 0
+        while offset < len(dados):
+            _, _, _, tamanho = _EVENTO.unpack_from(dados, offset)
+            nome = dados[offset + _EVENTO.size:offset + _EVENTO.size + tamanho].rstrip(b"\0")
+            offset += _EVENTO.size + tamanho
+            if nome.lower().endswith(b".pdf"):
+                caminhos.append(os.path.join(self.pasta, os.fsdecode(nome)))
+        return caminhos
+
+
+class ObservadorPolling:
+    """Fallback (Windows, macOS, NFS): lista a pasta a cada intervalo"""
+
+    def __init__(self, pasta, intervalo=INTERVALO_POLLING):
+        self.pasta = pasta
+        self.intervalo = intervalo
+        self._ultima_listagem = time.monotonic()
+
+    def aguardar(self, timeout):
+        time.sleep(min(timeout, self.intervalo))
+
+        # Lista no máximo uma vez por intervalo, mesmo com o laço girando rápido
+        if time.monotonic() - self._ultima_listagem < self.intervalo:
+            return []
+        self._ultima_listagem = time.monotonic()
+        return listar_pdfs(self.pasta)
+
+
+def listar_pdfs(pasta):
+    return [os.path.join(pasta, f) for f in os.listdir(pasta) if f.lower().endswith(".pdf")]
+
+
+def criar_observador(pasta, modo, intervalo):
+    if modo in ("auto", "inotify") and sys.platform.startswith("linux"):
+        try:
+            return ObservadorInotify(pasta)
+        except OSError:
+            if modo == "inotify":
+                raise
+    elif modo == "inotify":
+        raise OSError("inotify só está disponível no Linux")
+
+    return ObservadorPolling(pasta, intervalo)
+
+
+# ============================================================================
+# Daemon
+# ============================================================================
+
+def executar(args):
+    for pasta in (args.entrada, args.saida, args.falhas):
+        os.makedirs(pasta, exist_ok=True)
+
+    estado = EstadoIngestao(args.estado)
+    observador = criar_observador(args.entrada, args.modo, args.intervalo)
+    print(f"Observando {args.entrada} ({type(observador).__name__}, {args.workers} workers)")
+
+    parar = []
+    signal.signal(signal.SIGINT, lambda *_: parar.append(True))
+    signal.signal(signal.SIGTERM, lambda *_: parar.append(True))
+
+    em_andamento = {}  # future -> (caminho, stat, hash)
+    pendentes = listar_pdfs(args.entrada)  # Catch-up na partida: o estado descarta o que já foi feito
+
+    # Arquivos que estavam em voo quando um worker caiu (OOM, segfault no pdfium/paddle).
+    # Voltam para a fila e rodam sozinhos: se o pool cair de novo, a culpa é deles
+    quedas = Counter()
+
+    def novo_pool():
+        return ProcessPoolExecutor(max_workers=args.workers, initializer=_inicializar_worker)
+
+    def concluir(caminho, st, conteudo_hash, erro):
+        quedas.pop(caminho, None)
+        estado.registrar(caminho, st, conteudo_hash, erro)
+        print(f"{'❌ Erro' if erro else '✔ Sucesso'}: {os.path.basename(caminho)}")
+
+    pool = novo_pool()
+    try:
+        while not parar:
+            # Arquivo que chegou de novo enquanto a versão anterior está em voo: volta
+            # para a fila e é reavaliado quando ela terminar (o estado decide se mudou)
+            adiados = []
+            quebrou = False
+
+            # Fila limitada: no máximo 2x workers em voo, o resto espera a próxima volta
+            while pendentes and len(em_andamento) < args.workers * 2:
+                if any(c in quedas for c, _, _ in em_andamento.values()):
+                    break  # Suspeito de derrubar o pool rodando sozinho
+
+                caminho = pendentes.pop(0)
+
+                if caminho in (c for c, _, _ in em_andamento.values()):
+                    adiados.append(caminho)
+                    continue
+
+                if caminho in quedas and em_andamento:
+                    pendentes.insert(0, caminho)
+                    break  # Espera o que está em voo terminar para rodar sozinho
+
+                try:
+                    st = os.stat(caminho)
+                except FileNotFoundError:
+                    quedas.pop(caminho, None)
+                    continue
+
+                if isinstance(observador, ObservadorPolling) and time.time() - st.st_mtime < ESTABILIDADE_SEGUNDOS:
+                    continue  # Ainda sendo copiado; a próxima listagem pega
+
+                precisa, conteudo_hash = estado.precisa_processar(caminho, st)
+                if precisa:
+                    try:
+                        futuro = pool.submit(processar_arquivo, caminho, args.saida, args.falhas, args.timeout)
+                    except BrokenProcessPool:
+                        pendentes.insert(0, caminho)
+                        quebrou = True
+                        break
+                    em_andamento[futuro] = (caminho, st, conteudo_hash)
+
+            pendentes.extend(adiados)
+
+            if em_andamento and not quebrou:
+                concluidos, _ = wait(em_andamento, timeout=0.05, return_when=FIRST_COMPLETED)
+                for futuro in concluidos:
+                    try:
+                        # O worker devolve stat/hash dos bytes que de fato leu
+                        st_lido, hash_lido, erro = futuro.result()
+                    except BrokenProcessPool:
+                        quebrou = True
+                        continue
+                    except Exception as e:
+                        st_lido, hash_lido, erro = None, None, str(e)
+
+                    caminho, st, conteudo_hash = em_andamento.pop(futuro)
+                    concluir(caminho, st_lido or st, hash_lido or conteudo_hash, erro)
+
+            if quebrou:
+                # O trabalho em voo se perdeu com o pool: nada disso é falha do arquivo
+                perdidos = []
+                for futuro, (caminho, st, conteudo_hash) in em_andamento.items():
+                    if futuro.done() and not futuro.cancelled() and futuro.exception() is None:
+                        st_lido, hash_lido, erro = futuro.result()  # Terminou antes da queda
+                        concluir(caminho, st_lido or st, hash_lido or conteudo_hash, erro)
+                    else:
+                        perdidos.append((caminho, st, conteudo_hash))
+                em_andamento.clear()
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = novo_pool()
+
+                for caminho, st, conteudo_hash in reversed(perdidos):
+                    if len(perdidos) == 1 and quedas[caminho]:
+                        # Caiu de novo rodando sozinho: o arquivo derruba o worker
+                        erro = "Worker caiu ao processar o arquivo (falta de memória ou falha no parser)"
+                        nome = os.path.splitext(os.path.basename(caminho))[0] + ".json"
+                        _gravar_registro(os.path.join(args.falhas, nome),
+                                         {"arquivo": os.path.basename(caminho), "status": "ERRO", "erro": erro})
+                        concluir(caminho, st, conteudo_hash, erro)
+                    else:
+                        quedas[caminho] += 1
+                        pendentes.insert(0, caminho)
+                        print(f"⚠ Worker caiu; de volta à fila: {os.path.basename(caminho)}")
+
+            # Com trabalho em voo não bloqueia no observador por muito tempo
+            novos = observador.aguardar(0.05 if em_andamento or pendentes else args.intervalo)
+            pendentes.extend(c for c in novos if c not in pendentes)
+    finally:
+        pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Daemon de ingestão: processa PDFs que chegam na pasta de entrada")
+    parser.add_argument("--entrada", default=PASTA_ENTRADA, help="Pasta observada (inbox)")
+    parser.add_argument("--saida", default=PASTA_SAIDA, help="JSONs extraídos com sucesso")
+    parser.add_argument("--falhas", default=PASTA_FALHAS, help="JSONs de erro")
+    parser.add_argument("--estado", default=ARQUIVO_ESTADO, help="Banco SQLite com o estado dos arquivos")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Processos de extração")
+    parser.add_argument("--modo", choices=["auto", "inotify", "polling"], default="auto",
+                        help="auto = inotify no Linux, polling nos demais")
+    parser.add_argument("--intervalo", type=float, default=INTERVALO_POLLING,
+                        help="Segundos entre listagens no modo polling")
+    parser.add_argument("--timeout", type=float, default=TIMEOUT_ARQUIVO,
+                        help="Segundos máximos de extração por arquivo (0 = sem limite)")
+    executar(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
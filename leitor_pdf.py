@@ -0,0 +1,228 @@
+import io
+import os
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pdfplumber
+
+from cache_paginas import CachePaginas, LIMITE_CACHE_PAGINAS_MB, hash_fonte, hash_imagem
+
+# Acima desse número de páginas a extração é dividida entre processos
+# (faturas agrupadas com muitas UCs); abaixo disso o custo do pool não compensa
+LIMITE_PAGINAS_PARALELO = int(os.getenv("LIMITE_PAGINAS_PARALELO", "12"))
+MAX_WORKERS_PAGINAS = int(os.getenv("MAX_WORKERS_PAGINAS", str(os.cpu_count() or 2)))
+
+# Pools de extração: "processo" (padrão, contorna o GIL) ou "thread" (menos memória,
+# sem custo de serializar o PDF); comparável com carga.py
+TIPO_EXECUTOR = os.getenv("TIPO_EXECUTOR", "processo")
+
+# OCR de páginas sem camada de texto (PDF escaneado)
+DPI_OCR = int(os.getenv("DPI_OCR", "300"))
+IDIOMA_OCR = "pt"
+
+_pool = None
+_ocr_engine = None
+_cache = None
+
+
+def _abrir(fonte):
+    # Workers recebem bytes (BytesIO não é picklável); caminho é repassado direto
+    return pdfplumber.open(io.BytesIO(fonte) if isinstance(fonte, bytes) else fonte)
+
+
+def criar_executor(max_workers):
+    if TIPO_EXECUTOR == "thread":
+        return ThreadPoolExecutor(max_workers=max_workers)
+    return ProcessPoolExecutor(max_workers=max_workers)
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        _pool = criar_executor(MAX_WORKERS_PAGINAS)
+    return _pool
+
+
+def _get_ocr_engine():
+    global _ocr_engine
+    if _ocr_engine is None:
+        # Import tardio: paddleocr é pesado e só é necessário para PDFs escaneados
+        from paddleocr import PaddleOCR
+        _ocr_engine = PaddleOCR(lang=IDIOMA_OCR)
+    return _ocr_engine
+
+
+def _get_cache():
+    """Cache de páginas/OCR do processo (None se desligado com LIMITE_CACHE_PAGINAS_MB=0)"""
+    global _cache
+    if _cache is None and LIMITE_CACHE_PAGINAS_MB > 0:
+        _cache = CachePaginas()
+    return _cache
+
+
+@lru_cache(maxsize=1)
+def versao_ocr():
+    """Identifica o motor de OCR: trocar versão ou idioma invalida o texto em cache"""
+    from importlib.metadata import version, PackageNotFoundError
+
+    try:
+        return f"paddleocr-{version('paddleocr')}-{IDIOMA_OCR}"
+    except PackageNotFoundError:
+        return f"paddleocr-desconhecida-{IDIOMA_OCR}"
+
+
+def renderizar_pagina(fonte, indice, dpi=DPI_OCR, chave_pdf=None):
+    """
+    Rasteriza uma página com pypdfium2 (imagem PIL em tons de cinza).
+    Passa pelo cache de páginas; chave_pdf evita recalcular o hash do PDF a cada página.
+    """
+    cache = _get_cache()
+    if cache:
+        chave_pdf = chave_pdf or hash_fonte(fonte)
+        imagem = cache.imagem(chave_pdf, indice, dpi)
+        if imagem is not None:
+            return imagem
+
+    import pypdfium2 as pdfium
+
+    pdf = pdfium.PdfDocument(fonte)
+    try:
+        imagem = pdf[indice].render(scale=dpi / 72).to_pil().convert("L")
+    finally:
+        pdf.close()
+
+    if cache:
+        cache.guardar_imagem(chave_pdf, indice, dpi, imagem)
+    return imagem
+
+
+def ocr_imagem(imagem):
+    """Roda o OCR numa imagem de página e devolve o texto linha a linha"""
+    cache = _get_cache()
+    if cache:
+        chave_imagem, versao = hash_imagem(imagem), versao_ocr()
+        texto = cache.texto_ocr(chave_imagem, versao)
+        if texto is not None:
+            return texto
+
+    import numpy as np
+
+    resultado = _get_ocr_engine().ocr(np.array(imagem.convert("RGB")))
+
+    linhas = []
+    for bloco in resultado or []:
+        # paddleocr >= 3 devolve dicts com "rec_texts"; 2.x devolve [box, (texto, conf)]
+        if hasattr(bloco, "get") and "rec_texts" in bloco:
+            linhas.extend(bloco["rec_texts"])
+        else:
+            linhas.extend(linha[1][0] for linha in bloco or [])
+
+    texto = "\n".join(linhas)
+
+    if cache:
+        cache.guardar_texto_ocr(chave_imagem, versao, texto)
+    return texto
+
+
+def ocr_pagina(fonte, indice, dpi=DPI_OCR, chave_pdf=None):
+    return ocr_imagem(renderizar_pagina(fonte, indice, dpi, chave_pdf))
+
+
+def _iterar_intervalo(fonte, inicio=0, fim=None, ocr=False):
+    """Gera o texto das páginas [inicio, fim), liberando o cache de cada página logo após o uso"""
+    chave_pdf = None
+
+    with _abrir(fonte) as pdf:
+        for indice in range(inicio, len(pdf.pages) if fim is None else fim):
+            page = pdf.pages[indice]
+            texto = page.extract_text() or ""
+
+            # O pdfplumber guarda chars/objetos de layout em cada página;
+            # close() limpa esse cache (flush_cache + textmap), senão a memória
+            # cresce até o fim do "with" e lotes longos não param de crescer
+            page.close()
+
+            if ocr and not texto.strip():
+                # Hash do PDF só quando alguma página precisa de OCR (e uma vez por intervalo)
+                if chave_pdf is None and _get_cache():
+                    chave_pdf = hash_fonte(fonte)
+                texto = ocr_pagina(fonte, indice, chave_pdf=chave_pdf)
+
+            yield texto
+
+
+def _extrair_intervalo(fonte, inicio, fim, ocr=False):
+    return list(_iterar_intervalo(fonte, inicio, fim, ocr))
+
+
+def _normalizar_fonte(fonte):
+    if hasattr(fonte, "read"):
+        return fonte.getvalue() if hasattr(fonte, "getvalue") else fonte.read()
+    return fonte
+
+
+def extrair_texto_pagina(fonte, indice):
+    """Texto de uma única página, no mesmo layout do extrair_texto_pdf (sem OCR)"""
+    fonte = _normalizar_fonte(fonte)
+    # pages= evita montar o objeto de todas as páginas do documento
+    with pdfplumber.open(io.BytesIO(fonte) if isinstance(fonte, bytes) else fonte, pages=[indice + 1]) as pdf:
+        pagina = pdf.pages[0]
+        texto = pagina.extract_text() or ""
+        pagina.close()
+    return texto
+
+
+def iterar_texto_paginas(fonte, ocr=False):
+    """Gera o texto de cada página em ordem, sem manter o documento inteiro em memória"""
+    return _iterar_intervalo(_normalizar_fonte(fonte), ocr=ocr)
+
+
+def _contar_paginas(fonte):
+    with _abrir(fonte) as pdf:
+        return len(pdf.pages)
+
+
+def extrair_texto_paginas(fonte, paralelo=None, ocr=False):
+    """
+    Extrai o texto página a página (lista na ordem do documento).
+    paralelo=None decide pelo LIMITE_PAGINAS_PARALELO; True/False força o modo.
+    """
+    fonte = _normalizar_fonte(fonte)
+    total = _contar_paginas(fonte)
+
+    if paralelo is None:
+        paralelo = total > LIMITE_PAGINAS_PARALELO
+
+    if not paralelo or total < 2 or MAX_WORKERS_PAGINAS < 2:
+        return _extrair_intervalo(fonte, 0, total, ocr)
+
+    # Blocos contíguos, um por worker: cada processo abre o PDF uma única vez.
+    # map() devolve na ordem de submissão, então a ordem das páginas é preservada
+    n_blocos = min(MAX_WORKERS_PAGINAS, total)
+    tamanho = -(-total // n_blocos)
+    intervalos = [(i, min(i + tamanho, total)) for i in range(0, total, tamanho)]
+
+    resultados = _get_pool().map(
+        _extrair_intervalo,
+        [fonte] * len(intervalos),
+        [i for i, _ in intervalos],
+        [f for _, f in intervalos],
+        [ocr] * len(intervalos)
+    )
+
+    return [texto for bloco in resultados for texto in bloco]
+
+
+def extrair_texto_ocr(fonte):
+    """
+    Texto do PDF inteiro por OCR, ignorando a camada de texto: retentativa das seções
+    que falharam quando essa camada existe mas vem corrompida (fonte sem mapa de caracteres)
+    """
+    fonte = _normalizar_fonte(fonte)
+    chave_pdf = hash_fonte(fonte) if _get_cache() else None
+    return "\n".join(ocr_pagina(fonte, indice, chave_pdf=chave_pdf) for indice in range(_contar_paginas(fonte)))
+
+
+def extrair_texto_pdf(fonte, paralelo=None, ocr=False):
+    """Texto completo do PDF (fonte = caminho, bytes ou file-like), páginas separadas por quebra de linha"""
+    return "\n".join(extrair_texto_paginas(fonte, paralelo, ocr))
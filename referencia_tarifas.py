@@ -0,0 +1,145 @@
+import os
+import sqlite3
+import threading
+from statistics import median
+
+ARQUIVO_REFERENCIA = os.getenv("ARQUIVO_REFERENCIA_TARIFAS", "referencia_tarifas.db")
+
+# Mínimo de faturas vistas na chave antes de a faixa aprendida valer.
+# A faixa é mediana ± largura, com largura = max(K_MAD x MAD normalizado,
+# TOLERANCIA_RELATIVA x mediana): uma tarifa mal lida não desloca a faixa como
+# deslocava o min/max, e faturas com tarifas idênticas (MAD = 0) ainda têm folga
+MIN_AMOSTRAS = 5
+K_MAD = 5.0
+TOLERANCIA_RELATIVA = 0.5
+
+# Amostras mais recentes por chave usadas no cálculo (a chave já é por mês)
+JANELA_AMOSTRAS = 500
+
+# Na detecção de anomalias só o teto é aplicado: linhas de bandeira injetada com
+# patamar ("... TE P1") também caem em TE e têm tarifa bem menor, legitimamente.
+# A referência só sinaliza (anomalias_detectadas); nunca altera o que foi extraído
+TIPOS_INDEXADOS = ("TE", "TUSD")
+
+# Fator que torna o MAD comparável ao desvio padrão numa distribuição normal
+_ESCALA_MAD = 1.4826
+
+
+def classe_tarifaria(dados):
+    """
+    Subclasse que muda a tarifa dentro do mesmo mês/modalidade/grupo: subgrupo
+    (B1, B2 rural...), tarifa social e alíquota de ICMS (a tarifa da fatura é com tributos)
+    """
+    tecnico = dados.get("tecnico") or {}
+    icms = ((dados.get("tributos") or {}).get("icms") or {}).get("aliquota_percentual")
+
+    partes = [((tecnico.get("classificacao") or "").split() or [""])[0]]
+    if tecnico.get("tarifa_social"):
+        partes.append("SOCIAL")
+    if icms is not None:
+        partes.append(f"ICMS{icms:g}")
+    return " ".join(partes)
+
+
+def faixa_robusta(tarifas):
+    """(mínima, máxima) aceitas para as amostras: mediana ± largura (MAD com piso relativo)"""
+    centro = median(tarifas)
+    mad = median(abs(t - centro) for t in tarifas) * _ESCALA_MAD
+    largura = max(K_MAD * mad, TOLERANCIA_RELATIVA * centro)
+    return centro - largura, centro + largura
+
+
+class ReferenciaTarifas:
+    """
+    Índice de tarifas TE/TUSD observadas por (mês, modalidade, grupo, classe), construído
+    incrementalmente a partir das faturas processadas. Amostras ficam num SQLite local
+    (WAL, como o armazém e o livro de créditos): workers da API, teste.py e ingestão
+    compartilham o mesmo índice, e a gravação é atômica entre processos.
+    """
+
+    def __init__(self, caminho=ARQUIVO_REFERENCIA):
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(caminho, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # Mesma fatura (chave de acesso) reenviada não conta duas vezes; sem chave, conta sempre
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS amostras (
+                id INTEGER PRIMARY KEY,
+                chave TEXT,
+                chave_acesso TEXT,
+                tarifa REAL,
+                UNIQUE (chave, chave_acesso)
+            )
+        """)
+
+    def fechar(self):
+        self.conn.close()
+
+    @staticmethod
+    def chave(dados, tipo):
+        """Chave da fatura (resultado do extract_all) para o tipo TE/TUSD, ou None sem mês"""
+        mes = (dados.get("fatura") or {}).get("mes_referencia")
+        if not mes:
+            return None
+
+        tecnico = dados.get("tecnico") or {}
+        partes = [mes, tecnico.get("modalidade_tarifaria"), tecnico.get("grupo_tarifario"),
+                  classe_tarifaria(dados), tipo]
+        return "|".join((p or "").upper() for p in partes)
+
+    def _faixa(self, chave):
+        tarifas = [t for t, in self.conn.execute(
+            "SELECT tarifa FROM amostras WHERE chave = ? ORDER BY id DESC LIMIT ?", (chave, JANELA_AMOSTRAS))]
+        if len(tarifas) < MIN_AMOSTRAS:
+            return None
+        return faixa_robusta(tarifas)
+
+    def faixa(self, dados, tipo):
+        """(mínima, máxima) esperadas para a tarifa, ou None se ainda não há amostras suficientes"""
+        chave = self.chave(dados, tipo)
+        if chave is None:
+            return None
+
+        with self._lock:
+            return self._faixa(chave)
+
+    def registrar(self, dados):
+        """
+        Alimenta o índice com as tarifas TE/TUSD de uma fatura (resultado do extract_all).
+        Tarifa fora da faixa atual não é aprendida: a fatura sinalizada não alarga a
+        própria referência. Devolve os tipos aprendidos.
+        """
+        if self.chave(dados, "TE") is None:
+            return []
+
+        # Uma tarifa por tipo por fatura (as linhas de injeção repetem a mesma tarifa)
+        tarifas = {}
+        for item in dados["itens"]:
+            if item["tipo"] in TIPOS_INDEXADOS and item["tarifa_unitaria"]:
+                tarifas.setdefault(item["tipo"], abs(item["tarifa_unitaria"]))
+
+        chave_acesso = dados["fatura"].get("chave_acesso")
+        aprendidos = []
+
+        with self._lock:
+            # BEGIN IMMEDIATE: consulta da faixa e inserção sem outro processo no meio
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for tipo, tarifa in tarifas.items():
+                    chave = self.chave(dados, tipo)
+                    faixa = self._faixa(chave)
+                    if faixa and not faixa[0] <= tarifa <= faixa[1]:
+                        continue
+
+                    cursor = self.conn.execute(
+                        "INSERT OR IGNORE INTO amostras (chave, chave_acesso, tarifa) VALUES (?, ?, ?)",
+                        (chave, chave_acesso, tarifa))
+                    if cursor.rowcount:
+                        aprendidos.append(tipo)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+        return aprendidos
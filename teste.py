@@ -1,27 +1,51 @@
 import os
+import sys
 import json
-import pdfplumber
+import argparse
+import statistics
+import threading
+import tracemalloc
 from extractor import CopelExtractor
+from leitor_pdf import extrair_texto_pdf
+from referencia_tarifas import ReferenciaTarifas
+from creditos_scee import LivroCreditosSCEE
+from armazem_faturas import ArmazemFaturas
+from cache_paginas import hash_fonte
 
 # ConfiguraÃ§Ãµes
 PASTA_PDFS = r"D:\filtrado"
 ARQUIVO_SAIDA = "resultado_todos_pdfs.txt"
 
+# Perfil de memoria: fatura cujo pico passa de FATOR_OUTLIER x a mediana do lote e marcada
+FATOR_OUTLIER = 3.0
+
+# Intervalo de amostragem do RSS durante cada fatura (pico real, nao so antes/depois)
+INTERVALO_AMOSTRA_RSS = 0.005
+
 # Inicializa o extrator profissional
+# O lote tambem alimenta a referencia de tarifas usada pela API nas anomalias
+# e o livro de creditos SCEE consultado em /creditos/{uc}
+referencia = ReferenciaTarifas()
+livro_creditos = LivroCreditosSCEE()
 ex = CopelExtractor()
 
+# Texto bruto de cada PDF fica guardado: correcoes no extrator sao aplicadas
+# com "python armazem_faturas.py" sem reler o acervo
+armazem = ArmazemFaturas()
+
 
 def processar_pdf(caminho_pdf):
     nome_arquivo = os.path.basename(caminho_pdf)
 
     try:
-        with pdfplumber.open(caminho_pdf) as pdf:
-            # Extrai texto de todas as pÃ¡ginas e une em uma string
-            raw_text = "\n".join([page.extract_text() or "" for page in pdf.pages])
+        raw_text = extrair_texto_pdf(caminho_pdf)
 
         # MÃ‰TODO AUTOMÃTICO: extract_all traz todos os mÃ³dulos (histÃ³rico, tributos, solar, etc)
         # Se novos campos forem adicionados no extrator, eles aparecerÃ£o aqui automaticamente.
         dados_extraidos = ex.extract_all(raw_text)
+        referencia.registrar(dados_extraidos)
+        livro_creditos.registrar(dados_extraidos)
+        armazem.guardar(hash_fonte(caminho_pdf), nome_arquivo, raw_text, dados_extraidos)
 
         # Adiciona metadados do arquivo
         resultado = {
@@ -42,25 +66,141 @@ def processar_pdf(caminho_pdf):
         }
 
 
+def rss_atual_mb():
+    """RSS atual do processo em MB (None se a plataforma nao expoe)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    try:
+        import resource
+        # Sem /proc: ru_maxrss e o pico do processo (kB no Linux, bytes no macOS)
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss / 1024 / 1024 if sys.platform == "darwin" else maxrss / 1024
+    except ImportError:
+        return None
+
+
+class AmostradorRSS:
+    """Thread que le o RSS a cada INTERVALO_AMOSTRA_RSS e guarda o maior valor visto"""
+
+    def __init__(self, intervalo=INTERVALO_AMOSTRA_RSS):
+        self.intervalo = intervalo
+        self.pico = None
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._amostrar, daemon=True)
+
+    def _registrar(self):
+        rss = rss_atual_mb()
+        if rss is not None and (self.pico is None or rss > self.pico):
+            self.pico = rss
+
+    def _amostrar(self):
+        while not self._parar.wait(self.intervalo):
+            self._registrar()
+
+    def __enter__(self):
+        self._registrar()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        self._thread.join()
+        self._registrar()
+
+
+def processar_pdf_com_perfil(caminho_pdf):
+    """
+    Processa o PDF medindo o pico de alocacao Python (tracemalloc) e o pico de RSS
+    amostrado durante o processamento (pega fatura que sobe e libera antes do fim)
+    """
+    rss_antes = rss_atual_mb()
+    tracemalloc.reset_peak()
+
+    with AmostradorRSS() as amostrador:
+        resultado = processar_pdf(caminho_pdf)
+
+    _, pico = tracemalloc.get_traced_memory()
+    rss_depois = rss_atual_mb()
+    medido = rss_antes is not None and amostrador.pico is not None
+
+    resultado["memoria"] = {
+        "pico_python_mb": round(pico / 1024 / 1024, 2),
+        "rss_pico_mb": round(amostrador.pico, 2) if medido else None,
+        # Quanto o RSS subiu acima do inicial no pior momento da fatura
+        "rss_pico_delta_mb": round(amostrador.pico - rss_antes, 2) if medido else None,
+        "rss_final_mb": round(rss_depois, 2) if rss_depois is not None else None
+    }
+    return resultado
+
+
+def relatorio_memoria(resultados):
+    """Imprime o perfil por fatura e marca os outliers de pico (heap Python ou RSS)"""
+    picos = [r["memoria"]["pico_python_mb"] for r in resultados]
+    mediana = statistics.median(picos) if picos else 0
+    deltas = [r["memoria"]["rss_pico_delta_mb"] for r in resultados if r["memoria"]["rss_pico_delta_mb"] is not None]
+    # Piso de 1 MB: com a mediana perto de zero qualquer ruido viraria outlier
+    mediana_rss = max(statistics.median(deltas), 1.0) if deltas else 0
+
+    print("\n================ PERFIL DE MEMORIA ================")
+    for r in resultados:
+        mem = r["memoria"]
+        outlier = (mediana > 0 and mem["pico_python_mb"] > mediana * FATOR_OUTLIER) or \
+                  (mem["rss_pico_delta_mb"] is not None and mem["rss_pico_delta_mb"] > mediana_rss * FATOR_OUTLIER)
+        r["memoria"]["outlier"] = outlier
+
+        linha = f"{'!!' if outlier else '  '} {r['arquivo']}: pico Python {mem['pico_python_mb']} MB"
+        if mem["rss_pico_mb"] is not None:
+            linha += f" | pico RSS {mem['rss_pico_mb']} MB ({mem['rss_pico_delta_mb']:+} MB)"
+        print(linha)
+
+    outliers = [r["arquivo"] for r in resultados if r["memoria"]["outlier"]]
+    print(f"\nMediana do pico Python: {round(mediana, 2)} MB | Mediana do pico RSS acima do inicial: "
+          f"{round(mediana_rss, 2)} MB | Outliers (> {FATOR_OUTLIER}x mediana): {len(outliers)}")
+
+    # Crescimento do RSS do primeiro ao ultimo arquivo: deve ficar estavel em lotes longos
+    rss = [r["memoria"]["rss_final_mb"] for r in resultados if r["memoria"]["rss_final_mb"] is not None]
+    if len(rss) >= 2:
+        print(f"RSS inicial {rss[0]} MB -> final {rss[-1]} MB ({round(rss[-1] - rss[0], 2):+} MB)")
+
+
 def main():
-    if not os.path.exists(PASTA_PDFS):
-        print(f"Erro: A pasta {PASTA_PDFS} nÃ£o existe.")
+    parser = argparse.ArgumentParser(description="Processa em lote os PDFs de fatura Copel")
+    parser.add_argument("pasta", nargs="?", default=PASTA_PDFS, help="Pasta com os PDFs")
+    parser.add_argument("--perfil-memoria", action="store_true",
+                        help="Mede pico de memoria por fatura (tracemalloc + RSS amostrado) e marca outliers")
+    args = parser.parse_args()
+
+    pasta = args.pasta
+
+    if not os.path.exists(pasta):
+        print(f"Erro: A pasta {pasta} nÃ£o existe.")
         return
 
     resultados = []
 
     # Lista arquivos e processa
-    arquivos = [f for f in os.listdir(PASTA_PDFS) if f.lower().endswith(".pdf")]
+    arquivos = [f for f in os.listdir(pasta) if f.lower().endswith(".pdf")]
 
     if not arquivos:
         print("Nenhum PDF encontrado na pasta.")
         return
 
+    if args.perfil_memoria:
+        tracemalloc.start()
+
     for arquivo in arquivos:
-        caminho = os.path.join(PASTA_PDFS, arquivo)
-        res = processar_pdf(caminho)
+        caminho = os.path.join(pasta, arquivo)
+        res = processar_pdf_com_perfil(caminho) if args.perfil_memoria else processar_pdf(caminho)
         resultados.append(res)
 
+    if args.perfil_memoria:
+        tracemalloc.stop()
+        relatorio_memoria(resultados)
+
     # GravaÃ§Ã£o do arquivo de saÃ­da
     with open(ARQUIVO_SAIDA, "w", encoding="utf-8") as f:
         for r in resultados:
@@ -0,0 +1,39 @@
+import json
+
+import armazem_faturas
+from armazem_faturas import ArmazemFaturas, reprocessar
+from extractor import SECOES
+
+
+def test_falha_de_uma_fatura_nao_trava_o_reprocessamento(tmp_path, monkeypatch):
+    armazem = ArmazemFaturas(str(tmp_path / "armazem.db"))
+    for nome in ("boa", "veneno", "outra"):
+        armazem.guardar(nome, f"{nome}.pdf", f"texto da fatura {nome}")
+
+    original = armazem_faturas.ex.extract_itens_detalhado
+
+    def itens(text):
+        if "veneno" in text:
+            raise ValueError("tabela ilegível")
+        return original(text)
+
+    itens.versao = original.versao
+    monkeypatch.setattr(armazem_faturas.ex, "extract_itens_detalhado", itens)
+
+    por_secao, falhas = reprocessar(armazem, workers=1)
+    assert por_secao["itens"] == 2
+    assert falhas == {"itens": 1}
+    assert dict(armazem.erros()) == {"veneno.pdf": {"itens": "ValueError: tabela ilegível"}}
+
+    # Só a seção que falhou volta como pendente; as demais da fatura já estão na versão atual
+    assert [(h, refazer) for h, refazer, _ in armazem.pendencias()] == [("veneno", ["itens"])]
+
+    # Corrigido o extrator, a próxima execução refaz só ela e limpa o erro
+    monkeypatch.setattr(armazem_faturas.ex, "extract_itens_detalhado", original)
+    por_secao, falhas = reprocessar(armazem, workers=1)
+    assert por_secao == {"itens": 1} and not falhas
+    assert not list(armazem.erros())
+    assert armazem.pendencias() == []
+
+    dados = json.loads(armazem.conn.execute("SELECT dados FROM faturas WHERE hash = 'veneno'").fetchone()[0])
+    assert set(dados) == set(SECOES)
@@ -0,0 +1,92 @@
+import pytest
+
+from auditor_faturas import (TOLERANCIAS, auditar_fatura, regra_icms, regra_medicao_te, regra_scee_continuidade,
+                             regra_soma_itens)
+
+
+def _item(descricao, tipo, quantidade, valor_total=0.0):
+    return {"descricao": descricao, "tipo": tipo, "quantidade": quantidade, "valor_total": valor_total}
+
+
+def _resumo(mes, saldo_mes, acumulado, expirar=0.0, itens=(), uc="123"):
+    """Resumo como o auditar_fatura devolve para as regras de carteira"""
+    registro = {
+        "arquivo": f"{mes.replace('/', '_')}.pdf",
+        "dados": {
+            "cliente": {"uc": uc},
+            "fatura": {"mes_referencia": mes},
+            "itens": list(itens),
+            "solar_scee": {"saldo_mes_kwh": saldo_mes, "saldo_acumulado_kwh": acumulado,
+                           "saldo_expirar_kwh": expirar}
+        }
+    }
+    return auditar_fatura(registro, regras=())[1]
+
+
+COMPENSACAO_300 = [_item("ENERGIA INJ. OUC MPT TE 06/2024", "TE", -300),
+                   _item("ENERGIA INJ. OUC MPT TUSD 06/2024", "TUSD", -300),
+                   _item("ENERGIA INJ. BAND. AMARELA TE", "INJETADA", -50)]
+
+
+def test_soma_itens():
+    dados = {"fatura": {"valor_total": 100.0}, "itens": [_item("A", "TE", 1, 60.0), _item("B", "TUSD", 1, 40.0)]}
+    assert regra_soma_itens(dados, TOLERANCIAS) is None
+
+    dados["fatura"]["valor_total"] = 101.0
+    assert regra_soma_itens(dados, TOLERANCIAS)["diferenca"] == -1.0
+
+
+def test_icms():
+    dados = {"tributos": {"icms": {"base_calculo": 200.0, "aliquota_percentual": 19.0, "valor": 38.0}}}
+    assert regra_icms(dados, TOLERANCIAS) is None
+
+    dados["tributos"]["icms"]["valor"] = 40.0
+    assert regra_icms(dados, TOLERANCIAS)["esperado"] == 38.0
+
+
+def test_medicao_te_ignora_injecao():
+    dados = {"medicoes": [{"tipo": "CONSUMO", "consumo_kwh": 250}],
+             "itens": [_item("ENERGIA ELET CONSUMO", "TE", 250), _item("ENERGIA INJETADA TE 08/2024", "TE", -100)]}
+    assert regra_medicao_te(dados, TOLERANCIAS) is None
+
+    dados["medicoes"][0]["consumo_kwh"] = 300
+    assert regra_medicao_te(dados, TOLERANCIAS)["obtido"] == 250
+
+
+def test_scee_continuidade_mes_sem_uso_de_creditos():
+    resumos = [_resumo("05/2024", 100, 1000), _resumo("06/2024", 200, 1200)]
+    assert regra_scee_continuidade(resumos, TOLERANCIAS) == []
+
+
+def test_scee_queda_explicada_pela_compensacao_nao_e_violacao():
+    # Usou 300 kWh do banco: compensação nos itens explica a queda
+    resumos = [_resumo("05/2024", 100, 1000), _resumo("06/2024", 0, 700, itens=COMPENSACAO_300)]
+    assert regra_scee_continuidade(resumos, TOLERANCIAS) == []
+
+
+def test_scee_queda_alem_da_compensacao_e_violacao():
+    # Crédito de bandeira (INJETADA) não conta como kWh compensado
+    resumos = [_resumo("05/2024", 100, 1000), _resumo("06/2024", 0, 600, itens=COMPENSACAO_300)]
+    violacoes = regra_scee_continuidade(resumos, TOLERANCIAS)
+    assert [(v["esperado"], v["obtido"], v["mes_referencia"]) for v in violacoes] == [(700, 600, "06/2024")]
+
+
+def test_scee_queda_por_expiracao_do_mes_anterior():
+    resumos = [_resumo("05/2024", 100, 1000, expirar=150), _resumo("06/2024", 0, 850)]
+    assert regra_scee_continuidade(resumos, TOLERANCIAS) == []
+
+
+def test_scee_aumento_sem_credito_e_violacao():
+    resumos = [_resumo("05/2024", 100, 1000), _resumo("06/2024", 50, 1200, itens=COMPENSACAO_300)]
+    assert [v["esperado"] for v in regra_scee_continuidade(resumos, TOLERANCIAS)] == [1050]
+
+
+@pytest.mark.parametrize("meses", [("05/2024", "07/2024"), ("12/2023", "02/2024")])
+def test_scee_buraco_no_historico_nao_compara(meses):
+    resumos = [_resumo(meses[0], 100, 1000), _resumo(meses[1], 0, 0)]
+    assert regra_scee_continuidade(resumos, TOLERANCIAS) == []
+
+
+def test_scee_virada_de_ano_compara():
+    resumos = [_resumo("12/2023", 100, 1000), _resumo("01/2024", 0, 0)]
+    assert len(regra_scee_continuidade(resumos, TOLERANCIAS)) == 1
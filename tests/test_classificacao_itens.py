@@ -0,0 +1,35 @@
+import os
+import re
+
+import pytest
+
+from extractor import CopelExtractor
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DUMP = os.path.join(RAIZ, "resultado_todos_pdfs.txt")
+
+
+def _descricoes_do_dump():
+    """(descrição, tipo) de cada item já extraído no dump das faturas reais, sem repetição"""
+    with open(DUMP, encoding="utf-8") as f:
+        pares = re.findall(r'"descricao": "([^"]*)",\s*"tipo": "([^"]*)"', f.read())
+    return sorted(set(pares))
+
+
+@pytest.mark.parametrize("descricao, tipo", _descricoes_do_dump())
+def test_tipo_igual_ao_dump_das_faturas_reais(descricao, tipo):
+    assert CopelExtractor().classify_item(descricao) == tipo
+
+
+@pytest.mark.parametrize("descricao, tipo", [
+    # Crédito de bandeira: TE no fim não faz do item um TE
+    ("ENERGIA INJ. BAND. AMARELA TE", "INJETADA"),
+    ("ENERGIA INJ. BAND. VERMELHA TE P1", "TE"),
+    # Termos casam palavra inteira: IP não casa em MUNICIPIO, GD não casa dentro de palavra
+    ("CONT ILUMIN PUBLICA MUNICIPIO", "IP"),
+    ("ENERGIA INJETADA GDI", "INJETADA"),
+    ("DEMANDA USD", "DEMANDA"),
+    ("DESCONHECIDO XYZ", "OUTROS"),
+])
+def test_regras_de_palavra_inteira(descricao, tipo):
+    assert CopelExtractor().classify_item(descricao) == tipo
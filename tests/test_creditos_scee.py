@@ -0,0 +1,130 @@
+import pytest
+
+from creditos_scee import LivroCreditosSCEE, VALIDADE_CREDITOS_MESES, indice_para_mes, mes_para_indice
+
+
+def _fatura(mes, gerado, saldo, expirar=0.0, uc="123"):
+    """Resultado mínimo do extract_all com bloco SCEE"""
+    return {
+        "cliente": {"uc": uc},
+        "fatura": {"mes_referencia": mes},
+        "itens": [],
+        "solar_scee": {"saldo_mes_kwh": gerado, "saldo_acumulado_kwh": saldo,
+                       "saldo_expirar_kwh": expirar, "uc_geradora": None}
+    }
+
+
+def _somar_meses(mes, n):
+    return indice_para_mes(mes_para_indice(mes) + n)
+
+
+@pytest.fixture
+def livro(tmp_path):
+    livro = LivroCreditosSCEE(str(tmp_path / "creditos.db"))
+    yield livro
+    livro.fechar()
+
+
+# Saldo cresce 100 kWh/mês, sem consumo
+SEQUENCIA = [("01/2024", 100, 100), ("02/2024", 100, 200), ("03/2024", 100, 300), ("04/2024", 100, 400)]
+
+
+def test_ordem_de_chegada_nao_muda_o_extrato(tmp_path, livro):
+    for mes, gerado, saldo in SEQUENCIA:
+        livro.registrar(_fatura(mes, gerado, saldo))
+
+    fora_de_ordem = LivroCreditosSCEE(str(tmp_path / "outro.db"))
+    for mes, gerado, saldo in [SEQUENCIA[i] for i in (3, 0, 2, 1)]:
+        fora_de_ordem.registrar(_fatura(mes, gerado, saldo))
+
+    assert fora_de_ordem.extrato("123") == livro.extrato("123")
+    assert [m["ajuste_kwh"] for m in livro.extrato("123")] == [0, 0, 0, 0]
+    assert livro.saldo("123") == 400
+
+
+def test_fatura_atrasada_que_nao_muda_saldo_para_cedo(livro):
+    for mes, gerado, saldo in [("01/2024", 100, 100), ("03/2024", 0, 100), ("04/2024", 0, 100)]:
+        livro.registrar(_fatura(mes, gerado, saldo))
+
+    # 02/2024 (sem geração nem consumo) chega depois: 03/2024 é recalculado, bate com
+    # o gravado e 04/2024 não é tocado
+    assert livro.registrar(_fatura("02/2024", 0, 100)) == 2
+    assert livro.saldo("123", "02/2024") == 100
+
+    # Fatura repetida do último mês só recalcula o próprio mês
+    assert livro.registrar(_fatura("04/2024", 0, 100)) == 1
+
+
+def test_lote_expira_em_60_meses(livro):
+    livro.registrar(_fatura("01/2020", 100, 100))
+    vencimento = _somar_meses("01/2020", VALIDADE_CREDITOS_MESES)
+    livro.registrar(_fatura(vencimento, 0, 0))
+
+    ultimo = livro.extrato("123")[-1]
+    assert ultimo["expirado_kwh"] == 100
+    assert ultimo["consumido_kwh"] == 0
+    assert livro.saldo("123") == 0
+
+
+def test_saldo_informado_maior_vira_lote_de_abertura_consumido_primeiro(livro):
+    livro.registrar(_fatura("01/2024", 100, 100))
+    # Copel informa 350: faltam 250 kWh de meses anteriores ao livro
+    livro.registrar(_fatura("02/2024", 50, 350))
+    # Consumo de 100: sai do lote de abertura (mais antigo)
+    livro.registrar(_fatura("03/2024", 0, 250))
+
+    fevereiro, marco = livro.extrato("123")[1:]
+    assert fevereiro["ajuste_kwh"] == 200
+    assert marco["consumido_kwh"] == 100
+    assert livro.projecao_expiracao("123", VALIDADE_CREDITOS_MESES) == [
+        {"mes_referencia": "01/2029", "expira_kwh": 100.0},
+        {"mes_referencia": "02/2029", "expira_kwh": 150.0},
+    ]
+
+
+def test_saldo_a_expirar_informado_comparado_com_projecao(livro):
+    livro.registrar(_fatura("01/2020", 100, 100))
+    vespera = _somar_meses("01/2020", VALIDADE_CREDITOS_MESES - 1)
+    livro.registrar(_fatura(vespera, 0, 100, expirar=100))
+
+    ultimo = livro.extrato("123")[-1]
+    assert ultimo["expirar_proximo_mes_kwh"] == 100
+    assert not ultimo["expiracao_divergente"]
+
+    livro.registrar(_fatura(vespera, 0, 100, expirar=40))
+    assert livro.extrato("123")[-1]["expiracao_divergente"]
+    assert livro.projecao_expiracao("123")[0]["divergente"]
+
+
+def test_livro_persiste_e_ve_gravacao_de_outro_processo(tmp_path, livro):
+    livro.registrar(_fatura("01/2024", 100, 100))
+
+    # Outra conexão (outro worker) grava; o cache do primeiro é invalidado
+    outro = LivroCreditosSCEE(str(tmp_path / "creditos.db"))
+    outro.registrar(_fatura("02/2024", 100, 200))
+    assert livro.saldo("123") == 200
+
+    livro.fechar()
+    reaberto = LivroCreditosSCEE(str(tmp_path / "creditos.db"))
+    assert reaberto.saldo("123") == 200
+    reaberto.fechar()
+    outro.fechar()
+
+
+def test_gravacao_de_outro_processo_so_recarrega_a_uc_afetada(tmp_path, livro):
+    for mes, gerado, saldo in SEQUENCIA[:3]:
+        livro.registrar(_fatura(mes, gerado, saldo, uc="A"))
+        livro.registrar(_fatura(mes, gerado, saldo, uc="B"))
+    historico_a = livro._ucs["A"]
+
+    outro = LivroCreditosSCEE(str(tmp_path / "creditos.db"))
+    outro.registrar(_fatura("04/2024", 100, 400, uc="B"))
+
+    # UC sem gravação nova segue no cache e no caminho incremental
+    assert livro.registrar(_fatura("04/2024", 100, 400, uc="A")) == 1
+    assert livro._ucs["A"] is historico_a
+    assert livro.saldo("B") == 400
+
+    # E o outro processo também vê a gravação do primeiro
+    assert outro.saldo("A") == 400
+    outro.fechar()
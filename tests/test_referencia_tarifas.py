@@ -0,0 +1,71 @@
+import pytest
+
+from referencia_tarifas import MIN_AMOSTRAS, ReferenciaTarifas
+
+
+def _fatura(te, tusd=0.35, chave_acesso=None, tarifa_social=False):
+    """Resultado mínimo do extract_all com uma linha TE e uma TUSD"""
+    return {
+        "fatura": {"mes_referencia": "09/2024", "chave_acesso": chave_acesso},
+        "tecnico": {"classificacao": "B1 Residencial", "modalidade_tarifaria": "CONVENCIONAL",
+                    "grupo_tarifario": "B", "tarifa_social": tarifa_social},
+        "tributos": {"icms": {"aliquota_percentual": 19.0}},
+        "itens": [{"tipo": "TE", "tarifa_unitaria": te}, {"tipo": "TUSD", "tarifa_unitaria": tusd}]
+    }
+
+
+@pytest.fixture
+def caminho(tmp_path):
+    return str(tmp_path / "referencia.db")
+
+
+def test_tarifa_mal_lida_nao_alarga_a_faixa(caminho):
+    referencia = ReferenciaTarifas(caminho)
+    for te in [0.40, 0.41, 0.39, 0.40, 0.42]:
+        referencia.registrar(_fatura(te))
+    teto = referencia.faixa(_fatura(0.40), "TE")[1]
+    assert 0.41 < teto < 0.8
+
+    # Tarifa absurda fica fora da faixa: não é aprendida e o teto não se move
+    assert referencia.registrar(_fatura(9.5)) == ["TUSD"]
+    assert referencia.faixa(_fatura(0.40), "TE")[1] == teto
+    referencia.fechar()
+
+
+def test_mediana_resiste_a_amostra_ruim_antes_da_faixa_valer(caminho):
+    referencia = ReferenciaTarifas(caminho)
+    for te in [9.5, 0.40, 0.41, 0.39, 0.40]:
+        referencia.registrar(_fatura(te))
+    assert referencia.faixa(_fatura(0.40), "TE")[1] < 1.0
+    referencia.fechar()
+
+
+def test_mesma_fatura_reenviada_conta_uma_vez(caminho):
+    referencia = ReferenciaTarifas(caminho)
+    for _ in range(MIN_AMOSTRAS):
+        referencia.registrar(_fatura(0.40, chave_acesso="4" * 44))
+    assert referencia.faixa(_fatura(0.40), "TE") is None
+    referencia.fechar()
+
+
+def test_classe_social_tem_faixa_propria(caminho):
+    referencia = ReferenciaTarifas(caminho)
+    for _ in range(MIN_AMOSTRAS):
+        referencia.registrar(_fatura(0.05, tarifa_social=True))
+    assert referencia.faixa(_fatura(0.40), "TE") is None
+    referencia.fechar()
+
+
+def test_instancias_compartilham_o_indice(caminho):
+    # Dois processos (workers da API, teste.py) gravando no mesmo arquivo
+    a, b = ReferenciaTarifas(caminho), ReferenciaTarifas(caminho)
+    for te in [0.40, 0.41, 0.39]:
+        a.registrar(_fatura(te))
+        b.registrar(_fatura(te))
+    assert a.faixa(_fatura(0.40), "TE") is not None
+    a.fechar()
+    b.fechar()
+
+    reaberta = ReferenciaTarifas(caminho)
+    assert reaberta.faixa(_fatura(0.40), "TE") is not None
+    reaberta.fechar()
@@ -0,0 +1,90 @@
+import re
+import time
+
+import pypdfium2 as pdfium
+
+from extractor import CopelExtractor
+from leitor_pdf import extrair_texto_pagina
+
+# Emitente Copel Distribuição (razão social ou CNPJ 04.368.898/0001-06)
+_REGEX_COPEL = re.compile(r"COPEL\s+DISTRIBUI|04\.?368\.?898", re.IGNORECASE)
+
+# Página de fatura: cabeçalho do DANF3E ou chave de acesso. Faturas de cooperativa
+# (COGECOM) e agrupadas trazem capa/carta antes; o rodapé "DANF3EA4A" não conta
+_REGEX_PAGINA_FATURA = re.compile(r"DANF3E\s+-|CHAVE\s+DE\s+ACESSO", re.IGNORECASE)
+
+# No texto do pdfium a UC é uma linha sozinha logo antes de "MM/AAAA vencimento R$ valor";
+# o extract_cliente_info, feito para a ordem do pdfplumber, pegaria ali o número da NF
+_REGEX_UC_CABECALHO = re.compile(r"^(\d{7,10})[ \t]*\r?\n\s*\d{2}/20\d{2}\s+\d{2}/\d{2}/20\d{2}\s+R\$", re.MULTILINE)
+
+ex = CopelExtractor()
+
+
+def _texto_rapido_pagina_fatura(fonte):
+    """
+    (índice da primeira página de fatura ou None, texto dela pelo pdfium, total de páginas).
+    Sem página de fatura, devolve o texto da primeira página. Em C, poucos ms por página.
+    A ordem das linhas difere do pdfplumber: a UC sai pelo _REGEX_UC_CABECALHO.
+    """
+    pdf = pdfium.PdfDocument(fonte)
+    try:
+        primeira = None
+        for indice in range(len(pdf)):
+            pagina = pdf[indice]
+            textpage = pagina.get_textpage()
+            try:
+                texto = textpage.get_text_range()
+            finally:
+                textpage.close()
+                pagina.close()
+
+            if _REGEX_PAGINA_FATURA.search(texto):
+                return indice, texto, len(pdf)
+            if primeira is None:
+                primeira = texto
+
+        return None, primeira or "", len(pdf)
+    finally:
+        pdf.close()
+
+
+def triar_pdf(fonte):
+    """
+    Triagem para roteamento: acha a primeira página de fatura pelo pdfium e nunca roda OCR.
+    Devolve UC, mês de referência, se é fatura Copel, se tem camada de texto
+    (False = escaneado, precisa de OCR no processamento) e o papel da UC no SCEE.
+    Cliente e mês saem do próprio texto do pdfium; o pdfplumber (~250 ms por página)
+    só roda, nessa página, quando o cabeçalho não está no layout esperado.
+    """
+    inicio = time.perf_counter()
+    if hasattr(fonte, "read"):
+        fonte = fonte.read()
+
+    indice, texto_rapido, paginas = _texto_rapido_pagina_fatura(fonte)
+    tem_texto = bool(texto_rapido.strip())
+    copel = bool(_REGEX_COPEL.search(texto_rapido))
+
+    resultado = {
+        "paginas": paginas,
+        "pagina_fatura": indice + 1 if indice is not None else None,
+        "tem_camada_texto": tem_texto,
+        "copel": copel,
+        "scee": ex.classify_scee(texto_rapido) if tem_texto else None,
+        "uc": None,
+        "mes_referencia": None,
+        "cliente": None
+    }
+
+    if tem_texto and copel:
+        cabecalho = _REGEX_UC_CABECALHO.search(texto_rapido)
+        if cabecalho and cabecalho.group(1) not in ex.blacklist:
+            dados = ex.extract_all(texto_rapido, ["cliente", "fatura"])
+            dados["cliente"]["uc"] = cabecalho.group(1)
+        else:
+            dados = ex.extract_all(extrair_texto_pagina(fonte, indice or 0), ["cliente", "fatura"])
+        resultado["uc"] = dados["cliente"]["uc"]
+        resultado["mes_referencia"] = dados["fatura"]["mes_referencia"]
+        resultado["cliente"] = dados["cliente"]
+
+    resultado["tempo_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+    return resultado